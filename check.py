@@ -14,9 +14,13 @@ Usage:
   python check_missing.py --dir /path/to/folder
   # optional tweaks:
   # python check_missing.py --start 1 --end 500 --prefix 2_p --width 5 --ext .json
+  # also list matching files outside the range:
+  # python check_missing.py --extras
 """
 from pathlib import Path
 import argparse
+import os
+import re
 from itertools import groupby
 
 def compress_ranges(nums):
@@ -42,36 +46,40 @@ def main():
     ap.add_argument("--prefix", default="2_p")
     ap.add_argument("--width", type=int, default=5)
     ap.add_argument("--ext", default=".json")
+    ap.add_argument("--extras", action="store_true", help="Also list matching files outside the expected range")
     args = ap.parse_args()
 
     folder = Path(args.dir)
 
-    # Build expected set
-    expected_idxs = list(range(args.start, args.end + 1))
-    expected_names = {f"{args.prefix}{i:0{args.width}d}{args.ext}" for i in expected_idxs}
+    expected_range = range(args.start, args.end + 1)
+    # One compiled match validates the shape and captures the index
+    name_re = re.compile(rf"{re.escape(args.prefix)}(\d{{{args.width}}}){re.escape(args.ext)}")
 
     # Scan existing following the pattern strictly
-    existing = set()
+    existing = {}  # name -> idx (only kept for --extras)
     existing_idxs = set()
-    for p in folder.iterdir():
-        if not p.is_file():
-            continue
-        name = p.name
-        if not (name.startswith(args.prefix) and name.endswith(args.ext)):
-            continue
-        core = name[len(args.prefix):-len(args.ext)]
-        if len(core) == args.width and core.isdigit():
-            idx = int(core)
-            existing.add(name)
-            existing_idxs.add(idx)
+    # scandir carries the file type from readdir, so no extra stat per entry
+    with os.scandir(folder) as it:
+        for de in it:
+            if not de.is_file():
+                continue
+            m = name_re.fullmatch(de.name)
+            if m:
+                idx = int(m.group(1))
+                existing_idxs.add(idx)
+                if args.extras:
+                    existing[de.name] = idx
 
-    missing_idxs = sorted(set(expected_idxs) - existing_idxs)
-    extra_names = sorted(existing - expected_names)
+    # Walking the expected range yields the missing indexes already sorted
+    missing_idxs = [i for i in expected_range if i not in existing_idxs]
+    extra_names = []
+    if args.extras:
+        extra_names = sorted(n for n, i in existing.items() if not (args.start <= i <= args.end))
 
     # Report
     print(f"Checked folder: {folder.resolve()}")
     print(f"Pattern: {args.prefix}{'0'*args.width}{args.ext} | Range: {args.start}..{args.end}")
-    print(f"Expected files: {len(expected_idxs)}")
+    print(f"Expected files: {len(expected_range)}")
     print(f"Found matching files: {len(existing_idxs)}")
 
     if not missing_idxs:
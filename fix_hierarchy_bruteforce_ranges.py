@@ -27,15 +27,27 @@ Limitations:
 - If parsing fails, fallback: do not link range children.
 
 Outputs: SchN.bfrange.json + report hierarchy_report_bfrange.txt
+A SchN.bfrange.json.sig sidecar records the input+hierarchy digest so unchanged reruns skip the rewrite.
 """
 from __future__ import annotations
+import hashlib
 import json
+import mmap
+import os
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Callable, Dict, List, Tuple
 import re
 
+try:
+    import orjson  # optional, much faster (de)serialization
+except Exception:
+    orjson = None
+
 ROOT = Path('.')
-REPORT: List[str] = []
 ID_CODE_RE = re.compile(r"^Volume\d+-(.+)$", re.IGNORECASE)
 RANGE_RE = re.compile(r"^(.+)-(\d.*)$")  # simplified detection
 
@@ -61,28 +73,33 @@ def split_range(code: str) -> Tuple[str,str] | None:
 
 def build_indices(entries: List[dict]):
     code_to_entries: Dict[str, List[dict]] = {}
+    changed = False  # any bfCode added or altered
     for e in entries:
         if not isinstance(e, dict):
             continue
         code = extract_code(e)
-        e['bfCode'] = code
+        if 'bfCode' not in e or e['bfCode'] != code:
+            e['bfCode'] = code
+            changed = True
         if code:
             code_to_entries.setdefault(code, []).append(e)
-    return code_to_entries
+    return code_to_entries, changed
 
 
-def immediate_children_simple(codes: List[str]) -> Dict[str, Set[str]]:
-    children: Dict[str, Set[str]] = {c: set() for c in codes}
-    for c in codes:
-        if '-' in c:  # skip range for simple child logic
+def immediate_children_simple(codes: List[str], simple_idx: Dict[str, int]) -> Dict[int, List[int]]:
+    # A simple code's only possible immediate parent is the code with its last
+    # dot segment removed, so one pass over the codes suffices (no N x N scan).
+    # Works on positions into `codes`; simple_idx maps simple code -> position.
+    children: Dict[int, List[int]] = defaultdict(list)  # only codes with children get a list
+    for j, d in enumerate(codes):
+        if '-' in d or '.' not in d:  # skip range for simple child logic
+            continue
+        parent, tail = d.rsplit('.', 1)
+        if not tail:
             continue
-        prefix = c + '.'
-        plen = len(prefix)
-        for d in codes:
-            if d.startswith(prefix) and '-' not in d:
-                remainder = d[plen:]
-                if remainder and '.' not in remainder:
-                    children[c].add(d)
+        p = simple_idx.get(parent)
+        if p is not None:
+            children[p].append(j)
     return children
 
 
@@ -101,12 +118,49 @@ def numeric_value_for(code: str) -> Tuple[str, str] | None:
     return prefix, tail
 
 
-def expand_range_children(range_code: str, simple_codes: Set[str]) -> Set[str]:
-    # Identify children covered by range.
-    res: Set[str] = set()
-    rng = split_range(range_code)
+def build_range_indices(simple_idx: Dict[str, int]):
+    """Index simple codes numerically so range coverage is a bisect slice.
+
+    Returns (int_index, dotted_buckets), both holding code positions:
+      int_index: (keys, positions) for undotted codes, sorted by int value.
+      dotted_buckets: prefix -> (keys, positions) for dotted codes, keyed by the
+        part before the last '.' and sorted by the int value of the tail.
+    """
+    int_pairs: List[Tuple[int, int]] = []
+    dotted_pairs: Dict[str, List[Tuple[int, int]]] = {}
+    for sc, i in simple_idx.items():
+        if '.' not in sc:
+            try:
+                int_pairs.append((int(sc), i))
+            except ValueError:
+                continue
+            continue
+        prefix, tail = sc.rsplit('.', 1)
+        if not tail:
+            continue
+        try:
+            dotted_pairs.setdefault(prefix, []).append((int(tail), i))
+        except ValueError:
+            continue
+    int_index = _sorted_index(int_pairs)
+    dotted_buckets = {p: _sorted_index(pairs) for p, pairs in dotted_pairs.items()}
+    return int_index, dotted_buckets
+
+
+def _sorted_index(pairs: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    pairs.sort()
+    return [k for k, _ in pairs], [i for _, i in pairs]
+
+
+def _slice_between(index: Tuple[List[int], List[int]], lo: int, hi: int) -> List[int]:
+    keys, positions = index
+    return positions[bisect_left(keys, lo):bisect_right(keys, hi)]
+
+
+def expand_range_children(rng: Tuple[str,str] | None, int_index, dotted_buckets) -> List[int]:
+    # Identify positions of children covered by range (rng is the split_range() result).
     if not rng:
-        return res
+        return []
     left, right = rng
     # Case 1: pure integer range (no dot in left and right start with digits)
     if '.' not in left and '.' not in right:
@@ -114,156 +168,209 @@ def expand_range_children(range_code: str, simple_codes: Set[str]) -> Set[str]:
             l = int(left)
             r = int(right)
         except ValueError:
-            return res
-        for sc in simple_codes:
-            if '-' in sc:
-                continue
-            if '.' in sc:
-                continue
-            try:
-                v = int(sc)
-            except ValueError:
-                continue
-            if l <= v <= r:
-                res.add(sc)
-        return res
+            return []
+        return _slice_between(int_index, l, r)
     # Case 2: dotted range; require both sides share prefix before varying numeric portion
     # Strategy: find common prefix up to last dot of left side; compare numeric tails at that depth
     if '.' in left and '.' in right:
         lpref, ltail = left.rsplit('.',1)
         rpref, rtail = right.rsplit('.',1)
         if lpref != rpref:
-            return res
+            return []
         try:
             li = int(ltail)
             ri = int(rtail)
         except ValueError:
-            return res
+            return []
         # Candidate codes must match lpref.<num> exactly within bounds
-        target_prefix = lpref + '.'
-        for sc in simple_codes:
-            if not sc.startswith(target_prefix):
-                continue
-            if '-' in sc:
-                continue
-            # Only accept one more segment beyond lpref (no deeper dots)
-            rest = sc[len(target_prefix):]
-            if not rest or '.' in rest:
-                continue
-            try:
-                vi = int(rest)
-            except ValueError:
-                continue
-            if li <= vi <= ri:
-                res.add(sc)
-    return res
+        bucket = dotted_buckets.get(lpref)
+        if bucket:
+            return _slice_between(bucket, li, ri)
+    return []
+
 
+def make_ancestor_lookup(simple_idx: Dict[str, int]) -> Callable[[str], int]:
+    """Return a memoized lookup of the position of a code or its closest dot-ancestor
+    present in simple_idx (-1 if none).
 
-def compute_broader(code: str, simple_set: Set[str]) -> str | None:
+    Sibling codes share the same ancestor chain, so each prefix is only
+    resolved once per file.
+    """
+    @lru_cache(maxsize=None)
+    def nearest(prefix: str) -> int:
+        pos = simple_idx.get(prefix)
+        if pos is not None:
+            return pos
+        i = prefix.rfind('.')
+        return nearest(prefix[:i]) if i > 0 else -1
+    return nearest
+
+
+def compute_broader(code: str, simple_idx: Dict[str, int], nearest: Callable[[str], int],
+                    rng: Tuple[str,str] | None = None) -> int:
+    """Position of the broader simple code in simple_idx, or -1 if none.
+
+    nearest comes from make_ancestor_lookup(simple_idx).
+    """
     if '-' in code:
-        # For range codes try dotted truncation if dotted
+        # For range codes (rng is the split_range() result) try dotted truncation if dotted
+        left, _ = rng or (None,None)
         if '.' in code:
-            left, _ = split_range(code) or (None,None)
             if left and '.' in left:
                 parent = left.rsplit('.',1)[0]
-                if parent in simple_set:
-                    return parent
+                if parent in simple_idx:
+                    return simple_idx[parent]
         # Otherwise attempt left side root for integer range
-        left, _ = split_range(code) or (None,None)
-        if left and left in simple_set:
-            return left
-        return None
-    # Simple code
-    if '.' not in code:
-        return None
-    parts = code.split('.')
-    for i in range(len(parts)-1,0,-1):
-        cand = '.'.join(parts[:i])
-        if cand in simple_set:
-            return cand
-    return None
+        if left and left in simple_idx:
+            return simple_idx[left]
+        return -1
+    # Simple code: the immediate dot-truncated parent, or its closest ancestor
+    i = code.rfind('.')
+    return nearest(code[:i]) if i > 0 else -1
 
 
-def range_parent(code: str, simple_set: Set[str]) -> str | None:
-    """Return the parent simple code that should list this range as a child.
+def range_parent(rng: Tuple[str,str] | None, simple_idx: Dict[str, int]) -> int:
+    """Return the position of the parent simple code that should list this range as a child (-1 if none).
     Examples:
       004-006 -> None (do not attach to 004 unless explicit requirement). We choose left root if exists.
       026.0001-026.0005 -> 026 (base before first dot of left side)
     Implementation:
       - For dotted range: take left side, take its base root (split at first '.') -> candidate parent.
       - If that candidate exists as simple code, return it.
-      - For pure integer range: take left side as candidate if exists in simple_set.
+      - For pure integer range: take left side as candidate if exists in simple_idx.
+    rng is the split_range() result for the range code.
     """
-    if '-' not in code:
-        return None
-    rng = split_range(code)
     if not rng:
-        return None
+        return -1
     left, _ = rng
     if '.' in left:
-        base_root = left.split('.',1)[0]
-        if base_root in simple_set:
-            return base_root
-    else:
-        if left in simple_set:
-            return left
-    return None
+        return simple_idx.get(left.split('.',1)[0], -1)
+    return simple_idx.get(left, -1)
+
+
+def load_json_bytes(raw):
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(bytes(raw))
+
+
+def load_json_file(path: Path):
+    """Parse a JSON file straight from a read-only mmap.
+
+    Returns (data, md5-of-input). Avoids holding both the raw bytes and a
+    decoded str copy of large inputs in memory.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap rejects empty files
+            raw = f.read()
+            return load_json_bytes(raw), hashlib.md5(raw)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            digest = hashlib.md5(mm)
+            with memoryview(mm) as mv:
+                return load_json_bytes(mv), digest
+
+
+def dump_json_bytes(data) -> bytes:
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def hierarchy_signature(input_md5, codes: List[str], broader: List[str | None],
+                        narrower: List[List[str]]) -> str:
+    """Digest of the input bytes (input_md5, from load_json_file) plus the computed hierarchy.
+
+    broader/narrower are parallel to codes (narrower lists already sorted).
+    Equal signatures mean the output file would be rewritten byte-for-byte,
+    so callers can skip the assignment and JSON write entirely.
+    """
+    h = input_md5.copy()
+    hier = {c: (broader[i], narrower[i]) for i, c in enumerate(codes)}
+    h.update(json.dumps(hier, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
 
 
-def process_file(path: Path):
+def sig_path_for(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + '.sig')
+
+
+def is_output_current(path: Path, out_path: Path) -> bool:
+    """True if out_path exists and is at least as new as its input."""
     try:
-        entries = json.loads(path.read_text(encoding='utf-8'))
+        return out_path.stat().st_mtime >= path.stat().st_mtime
+    except OSError:
+        return False
+
+
+def process_file(path: Path) -> List[str]:
+    lines: List[str] = []
+    try:
+        entries, input_md5 = load_json_file(path)
     except Exception as e:
-        REPORT.append(f"{path.name}: parse error {e}")
-        return
+        lines.append(f"{path.name}: parse error {e}")
+        return lines
     if not isinstance(entries, list):
-        REPORT.append(f"{path.name}: root not list")
-        return
-    code_to_entries = build_indices(entries)
+        lines.append(f"{path.name}: root not list")
+        return lines
+    code_to_entries, dirty = build_indices(entries)
+    # Struct-of-arrays layout: codes are addressed by position from here on and
+    # only translated back to strings when the hierarchy is emitted.
     codes = list(code_to_entries.keys())
-    simple_codes = {c for c in codes if '-' not in c}
-    range_codes = {c for c in codes if '-' in c}
+    simple_idx: Dict[str, int] = {c: i for i, c in enumerate(codes) if '-' not in c}
+    # Parse each range code once; helpers take the (left, right) tuple
+    range_parsed: Dict[int, Tuple[str,str] | None] = {i: split_range(c) for i, c in enumerate(codes) if '-' in c}
+    int_index, dotted_buckets = build_range_indices(simple_idx)
     # Simple immediate children
-    simple_child_map = immediate_children_simple(codes)
-    # Range children
-    range_children: Dict[str, Set[str]] = {}
-    for rc in range_codes:
-        range_children[rc] = expand_range_children(rc, simple_codes)
-    # Build union child map (initialize)
-    child_map: Dict[str, Set[str]] = {c: set() for c in codes}
-    for c, kids in simple_child_map.items():
-        child_map[c].update(kids)
-    for rc, kids in range_children.items():
-        child_map[rc].update(kids)
-    # Add range nodes themselves as children of their base parent if applicable
-    for rc in range_codes:
-        parent = range_parent(rc, simple_codes)
-        if parent:
-            child_map[parent].add(rc)
+    children = immediate_children_simple(codes, simple_idx)
+    for ri, rng in range_parsed.items():
+        # Range children
+        kids = expand_range_children(rng, int_index, dotted_buckets)
+        if kids:
+            children[ri].extend(kids)
+        # Add range nodes themselves as children of their base parent if applicable
+        parent = range_parent(rng, simple_idx)
+        if parent >= 0:
+            children[parent].append(ri)
     # Compute broader for each code
-    simple_set = simple_codes  # for lookup
-    broader_map: Dict[str, str | None] = {}
-    for c in codes:
-        broader_map[c] = compute_broader(c, simple_set)
-    # Assign hierarchy
-    for code, ents in code_to_entries.items():
-        narrower_sorted = sorted(child_map.get(code, []))
-        broader = broader_map.get(code)
-        for e in ents:
-            e['hierarchy'] = {
-                'broader': broader,
-                'narrower': narrower_sorted
-            }
+    nearest = make_ancestor_lookup(simple_idx)  # memoized per file
+    broader_pos = [compute_broader(c, simple_idx, nearest, range_parsed.get(i)) for i, c in enumerate(codes)]
+    # Translate positions back to codes once
+    broader = [codes[b] if b >= 0 else None for b in broader_pos]
+    narrower = [sorted(codes[j] for j in children[i]) if i in children else [] for i in range(len(codes))]
     out_path = path.with_name(path.stem.replace('.cleaned', '.bfrange') + '.json')
-    out_path.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding='utf-8')
-    REPORT.append(f"{path.name}: entries={len(entries)} codes={len(codes)} ranges={len(range_codes)}")
+    sig_path = sig_path_for(out_path)
+    new_sig = hierarchy_signature(input_md5, codes, broader, narrower)
+    if out_path.exists() and sig_path.exists() and sig_path.read_text(encoding='utf-8').strip() == new_sig:
+        lines.append(f"{path.name}: unchanged, skipped")
+        return lines
+    # Assign hierarchy (duplicates share the same dict)
+    for i, ents in enumerate(code_to_entries.values()):
+        hier = {'broader': broader[i], 'narrower': narrower[i]}
+        for e in ents:
+            if not dirty and e.get('hierarchy') != hier:
+                dirty = True
+            e['hierarchy'] = hier
+    # Input already carried this exact hierarchy: an existing, newer output
+    # would be rewritten with the same content, so skip the serialization.
+    if not dirty and is_output_current(path, out_path):
+        sig_path.write_text(new_sig + '\n', encoding='utf-8')
+        lines.append(f"{path.name}: input hierarchy already current, skipped write")
+        return lines
+    out_path.write_bytes(dump_json_bytes(entries))
+    sig_path.write_text(new_sig + '\n', encoding='utf-8')
+    lines.append(f"{path.name}: entries={len(entries)} codes={len(codes)} ranges={len(range_parsed)}")
+    return lines
 
 
 def main():
-    for p in sorted(Path('.').glob('Sch*.cleaned.json')):
-        process_file(p)
-    Path('hierarchy_report_bfrange.txt').write_text('\n'.join(REPORT)+'\n', encoding='utf-8')
-    print('\n'.join(REPORT))
+    report: List[str] = []
+    paths = sorted(Path('.').glob('Sch*.cleaned.json'))
+    # Files are independent; workers return their report lines in input order
+    with ProcessPoolExecutor() as ex:
+        for lines in ex.map(process_file, paths):
+            report.extend(lines)
+    Path('hierarchy_report_bfrange.txt').write_text('\n'.join(report)+'\n', encoding='utf-8')
+    print('\n'.join(report))
     print('Report written to hierarchy_report_bfrange.txt')
 
 if __name__ == '__main__':
@@ -11,11 +11,24 @@ Tables use notation patterns like:
 The hierarchy logic remains the same but adapted for table notation patterns.
 """
 from __future__ import annotations
+import hashlib
 import json
+import mmap
+import os
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Callable, Dict, List, Set, Tuple
 
-REPORT = []
+try:
+    import orjson  # optional, much faster (de)serialization
+except Exception:
+    orjson = None
+
+ID_TABLE_RE = re.compile(r"^T[^:]*:(.*)$", re.DOTALL)
 
 
 def extract_code(entry: dict) -> str | None:
@@ -25,14 +38,9 @@ def extract_code(entry: dict) -> str | None:
     if notation:
         return notation
     
-    # Fallback to id parsing if needed
-    id_str = entry.get('id', '')
-    if id_str.startswith('T'):
-        # Format like "T1:-04" -> "-04"
-        if ':' in id_str:
-            return id_str.split(':', 1)[1]
-    
-    return None
+    # Fallback to id parsing if needed, e.g. "T1:-04" -> "-04"
+    m = ID_TABLE_RE.match(entry.get('id', ''))
+    return m.group(1) if m else None
 
 
 def split_range(code: str) -> Tuple[str, str] | None:
@@ -48,41 +56,58 @@ def split_range(code: str) -> Tuple[str, str] | None:
 def build_indices(entries: List[dict]):
     """Build code to entries mapping."""
     code_to_entries: Dict[str, List[dict]] = {}
+    changed = False  # any bfCode added or altered
     for e in entries:
         if not isinstance(e, dict):
             continue
         code = extract_code(e)
-        e['bfCode'] = code
+        if 'bfCode' not in e or e['bfCode'] != code:
+            e['bfCode'] = code
+            changed = True
         if code:
             code_to_entries.setdefault(code, []).append(e)
-    return code_to_entries
+    return code_to_entries, changed
 
 
 def immediate_children_simple(codes: List[str]) -> Dict[str, Set[str]]:
     """Find immediate children for simple (non-range) codes."""
-    children: Dict[str, Set[str]] = {c: set() for c in codes}
-    for c in codes:
-        if '--' in c:  # skip range codes
-            continue
-        
-        # For table codes, look for immediate extensions
-        # E.g., "-09" is parent of "-092", "-093", etc.
-        for d in codes:
-            if d == c or '--' in d:
-                continue
-            
-            # Check if d is an immediate child of c
-            if d.startswith(c) and len(d) > len(c):
-                remainder = d[len(c):]
-                # Immediate child if remainder has no further structure
-                # For tables, this means remainder should be just digits
-                if remainder.isdigit() and len(remainder) <= 3:  # reasonable limit
-                    children[c].add(d)
+    children: Dict[str, Set[str]] = defaultdict(set)  # only codes with children get a set
+    code_set = {c for c in codes if '--' not in c}  # skip range codes
+    
+    # For table codes, a child extends its parent by 1-3 trailing digits
+    # E.g., "-09" is parent of "-092", "-093", etc.
+    # So each code only needs to test its (at most three) digit-stripped
+    # prefixes instead of scanning every other code.
+    for d in code_set:
+        for k in range(1, min(3, len(d) - 1) + 1):
+            if not d[-k:].isdigit():
+                break
+            parent = d[:-k]
+            if parent in code_set:
+                children[parent].add(d)
     
     return children
 
 
-def expand_range_children(range_code: str, simple_codes: Set[str]) -> Set[str]:
+def build_int_index(simple_codes: Set[str]) -> Tuple[List[int], List[str]]:
+    """Parse each numeric simple code once; returns (keys, codes) sorted by value.
+
+    "-04" and "-4" both map to 4, matching the range comparison below.
+    """
+    pairs: List[Tuple[int, str]] = []
+    for sc in simple_codes:
+        sc_num = sc.lstrip('-')
+        if not sc_num.isdigit():
+            continue
+        try:
+            pairs.append((int(sc_num), sc))
+        except ValueError:
+            continue
+    pairs.sort()
+    return [v for v, _ in pairs], [sc for _, sc in pairs]
+
+
+def expand_range_children(range_code: str, int_index: Tuple[List[int], List[str]]) -> Set[str]:
     """Find children covered by a range notation."""
     res: Set[str] = set()
     rng = split_range(range_code)
@@ -102,53 +127,45 @@ def expand_range_children(range_code: str, simple_codes: Set[str]) -> Set[str]:
     except ValueError:
         return res
     
-    for sc in simple_codes:
-        if '--' in sc:
-            continue
-        
-        # Extract numeric part for comparison
-        sc_num = sc.lstrip('-')
-        if not sc_num.isdigit():
-            continue
-            
-        try:
-            v = int(sc_num)
-        except ValueError:
-            continue
-            
-        if l <= v <= r:
-            res.add(sc)
+    # Simple codes were parsed once up front; the covered span is a bisect slice
+    keys, codes = int_index
+    res.update(codes[bisect_left(keys, l):bisect_right(keys, r)])
     
     return res
 
 
-def compute_broader(code: str, simple_set: Set[str]) -> str | None:
-    """Compute the broader (parent) code."""
+def make_prefix_lookup(simple_set: Set[str]) -> Callable[[str], str | None]:
+    """Return a memoized lookup of the longest prefix of a code (itself included)
+    that is in simple_set.
+
+    Sibling codes share their truncation paths, so each prefix is only
+    tested once per file.
+    """
+    @lru_cache(maxsize=None)
+    def nearest(prefix: str) -> str | None:
+        if prefix in simple_set:
+            return prefix
+        if len(prefix) <= 1:
+            return None
+        return nearest(prefix[:-1])
+    return nearest
+
+
+def compute_broader(code: str, nearest: Callable[[str], str | None]) -> str | None:
+    """Compute the broader (parent) code; nearest comes from make_prefix_lookup()."""
     if '--' in code:
         # For range codes, try to find parent by truncating
-        left, _ = split_range(code) or (None, None)
-        if left:
-            # Try progressively shorter versions
-            for i in range(len(left) - 1, 0, -1):
-                cand = left[:i]
-                if cand in simple_set:
-                    return cand
-        return None
+        return range_parent(code, nearest)
     
     # For simple codes, find parent by truncating
     if len(code) <= 1:
         return None
     
     # Try progressively shorter versions
-    for i in range(len(code) - 1, 0, -1):
-        cand = code[:i]
-        if cand in simple_set:
-            return cand
-    
-    return None
+    return nearest(code[:-1])
 
 
-def range_parent(code: str, simple_set: Set[str]) -> str | None:
+def range_parent(code: str, nearest: Callable[[str], str | None]) -> str | None:
     """Find which simple code should list this range as a child."""
     if '--' not in code:
         return None
@@ -160,95 +177,178 @@ def range_parent(code: str, simple_set: Set[str]) -> str | None:
     left, _ = rng
     
     # Try to find a parent by truncating the left side
-    for i in range(len(left) - 1, 0, -1):
-        cand = left[:i]
-        if cand in simple_set:
-            return cand
-    
-    return None
+    if len(left) <= 1:
+        return None
+    return nearest(left[:-1])
+
+
+def load_json_bytes(raw):
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(bytes(raw))
+
+
+def load_json_file(path: Path):
+    """Parse a JSON file straight from a read-only mmap.
+
+    Returns (data, md5-of-input). Avoids holding both the raw bytes and a
+    decoded str copy of large inputs in memory.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap rejects empty files
+            raw = f.read()
+            return load_json_bytes(raw), hashlib.md5(raw)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            digest = hashlib.md5(mm)
+            with memoryview(mm) as mv:
+                return load_json_bytes(mv), digest
+
+
+def dump_json_bytes(data) -> bytes:
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def hierarchy_signature(input_md5, codes: List[str], broader_map: Dict[str, str | None],
+                        child_map: Dict[str, Set[str]]) -> str:
+    """Digest of the input bytes (input_md5, from load_json_file) plus the computed hierarchy.
 
+    Equal signatures mean the output file would be rewritten byte-for-byte,
+    so callers can skip the assignment and JSON write entirely.
+    """
+    h = input_md5.copy()
+    hier = {c: (broader_map.get(c), sorted(child_map.get(c, ()))) for c in codes}
+    h.update(json.dumps(hier, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
 
-def process_file(path: Path):
-    """Process a single table file."""
+
+def sig_path_for(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + '.sig')
+
+
+def is_output_current(path: Path, out_path: Path) -> bool:
+    """True if out_path exists and is at least as new as its input."""
     try:
-        entries = json.loads(path.read_text(encoding='utf-8'))
+        return out_path.stat().st_mtime >= path.stat().st_mtime
+    except OSError:
+        return False
+
+
+def process_file(path: Path) -> List[str]:
+    """Process a single table file; returns its report lines."""
+    lines: List[str] = []
+    try:
+        entries, input_md5 = load_json_file(path)
     except Exception as e:
-        REPORT.append(f"{path.name}: parse error {e}")
-        return
+        lines.append(f"{path.name}: parse error {e}")
+        return lines
     
     if not isinstance(entries, list):
-        REPORT.append(f"{path.name}: root not list")
-        return
+        lines.append(f"{path.name}: root not list")
+        return lines
     
-    code_to_entries = build_indices(entries)
+    code_to_entries, dirty = build_indices(entries)
     codes = list(code_to_entries.keys())
     simple_codes = {c for c in codes if '--' not in c}
     range_codes = {c for c in codes if '--' in c}
     
-    REPORT.append(f"{path.name}: {len(entries)} entries, {len(simple_codes)} simple codes, {len(range_codes)} range codes")
+    lines.append(f"{path.name}: {len(entries)} entries, {len(simple_codes)} simple codes, {len(range_codes)} range codes")
     
     # Build simple children
     simple_child_map = immediate_children_simple(codes)
     
     # Build range children
+    int_index = build_int_index(simple_codes)
     range_children: Dict[str, Set[str]] = {}
     for rc in range_codes:
-        range_children[rc] = expand_range_children(rc, simple_codes)
+        range_children[rc] = expand_range_children(rc, int_index)
+    
+    # Prefix walks are shared by siblings; memoize them for this file
+    nearest = make_prefix_lookup(simple_codes)
     
     # Combine all children
-    child_map: Dict[str, Set[str]] = {c: set() for c in codes}
+    child_map: Dict[str, Set[str]] = defaultdict(set)
     for c, kids in simple_child_map.items():
         child_map[c].update(kids)
     
     for rc, kids in range_children.items():
-        child_map[rc].update(kids)
+        if kids:
+            child_map[rc].update(kids)
         # Also add this range as child of its parent
-        parent = range_parent(rc, simple_codes)
+        parent = range_parent(rc, nearest)
         if parent:
             child_map[parent].add(rc)
     
     # Compute broader relationships
     broader_map: Dict[str, str | None] = {}
     for c in codes:
-        broader_map[c] = compute_broader(c, simple_codes)
+        broader_map[c] = compute_broader(c, nearest)
+    
+    # Skip the rewrite when neither the input nor the hierarchy changed
+    out_path = path.with_name(path.stem.replace('.cleaned', '.bfrange') + '.json')
+    sig_path = sig_path_for(out_path)
+    new_sig = hierarchy_signature(input_md5, codes, broader_map, child_map)
+    if out_path.exists() and sig_path.exists() and sig_path.read_text(encoding='utf-8').strip() == new_sig:
+        lines.append(f"{path.name}: unchanged, skipped")
+        return lines
     
     # Update all entries with hierarchy
     updated_count = 0
     for c, entry_list in code_to_entries.items():
         narrower = sorted(child_map.get(c, set()))
         broader = broader_map.get(c)
+        # Entries without a prior hierarchy share one dict per code; entries
+        # that already carry one keep their other keys and share the list.
+        shared = {'narrower': narrower, 'broader': broader}
         
         for entry in entry_list:
             if 'hierarchy' not in entry:
-                entry['hierarchy'] = {}
-            entry['hierarchy']['narrower'] = narrower
-            entry['hierarchy']['broader'] = broader
+                entry['hierarchy'] = shared
+                dirty = True
+            else:
+                hier = entry['hierarchy']
+                if not dirty and (hier.get('narrower') != narrower or hier.get('broader') != broader):
+                    dirty = True
+                hier['narrower'] = narrower
+                hier['broader'] = broader
             updated_count += 1
     
-    REPORT.append(f"{path.name}: updated {updated_count} entries with hierarchy")
+    lines.append(f"{path.name}: updated {updated_count} entries with hierarchy")
+    
+    # Input already carried this exact hierarchy: an existing, newer output
+    # would be rewritten with the same content, so skip the serialization.
+    if not dirty and is_output_current(path, out_path):
+        sig_path.write_text(new_sig + '\n', encoding='utf-8')
+        lines.append(f"{path.name}: input hierarchy already current, skipped write")
+        return lines
     
     # Write output file
-    out_path = path.with_name(path.stem.replace('.cleaned', '.bfrange') + '.json')
-    out_path.write_text(json.dumps(entries, indent=2, ensure_ascii=False), encoding='utf-8')
-    REPORT.append(f"{path.name}: wrote {out_path.name}")
+    out_path.write_bytes(dump_json_bytes(entries))
+    sig_path.write_text(new_sig + '\n', encoding='utf-8')
+    lines.append(f"{path.name}: wrote {out_path.name}")
+    return lines
 
 
 def main():
     """Process all table files."""
+    report: List[str] = []
     table_files = sorted(Path('.').glob('Table*.cleaned.json'))
     
     if not table_files:
         print("No Table*.cleaned.json files found")
         return
     
-    for p in table_files:
-        process_file(p)
+    # Files are independent; workers return their report lines in input order
+    with ProcessPoolExecutor() as ex:
+        for lines in ex.map(process_file, table_files):
+            report.extend(lines)
     
     # Write report
     report_path = Path('hierarchy_report_tables_bfrange.txt')
-    report_path.write_text('\n'.join(REPORT) + '\n', encoding='utf-8')
+    report_path.write_text('\n'.join(report) + '\n', encoding='utf-8')
     
-    print('\n'.join(REPORT))
+    print('\n'.join(report))
     print(f'Report written to {report_path.name}')
 
 
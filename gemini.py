@@ -22,26 +22,33 @@ OTHER FEATURES (unchanged)
 """
 from __future__ import annotations
 
-import argparse, json, logging, os, re, sys, time, shutil, itertools
+import argparse, asyncio, errno, functools, hashlib, json, logging, os, random, re, sys, threading, time, shutil, itertools
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple, Any, Dict
+from typing import List, Optional, Tuple, Any, Dict, Iterable
 
-from tenacity import (
-    retry, stop_after_attempt, wait_exponential,
-    retry_if_exception_type, before_log, after_log, before_sleep_log
-)
-from tqdm import tqdm
 
-# Optional: for page-count validation only (no rendering in this script)
 try:
-    import fitz  # PyMuPDF
+    import orjson  # optional, faster JSON (de)serialization
+except Exception:
+    orjson = None
+
+try:
+    import aiofiles  # optional, async checkpoint writes
 except Exception:
-    fitz = None
+    aiofiles = None
 
 try:
-    from dotenv import load_dotenv  # optional
+    import ijson  # optional, incremental parsing of --stream output
 except Exception:
-    load_dotenv = None
+    ijson = None
+
+# fitz (PyMuPDF), dotenv and google.generativeai are optional or
+# only needed once the run starts; they are imported where used so that
+# --help and argument errors stay fast.
 
 LOG = logging.getLogger("pdf_to_ddc_dual_resumable")
 
@@ -55,41 +62,66 @@ def setup_logging(verbose: bool, lvl: Optional[str]) -> None:
 def parse_pages_arg(pages_arg: str, total_pages: int) -> List[int]:
     if not pages_arg or pages_arg.strip().lower() == "all":
         return list(range(1, total_pages + 1))
-    sel = set()
+    spans: List[Tuple[int, int]] = []
     for part in [x.strip() for x in pages_arg.split(",") if x.strip()]:
         if "-" in part:
             a, b = part.split("-", 1)
             start = max(1, int(a)); end = min(total_pages, int(b))
-            if start <= end: sel.update(range(start, end + 1))
         else:
-            n = int(part)
-            if 1 <= n <= total_pages: sel.add(n)
-    return sorted(sel)
+            start = end = int(part)
+            if not 1 <= start <= total_pages: continue
+        if start <= end: spans.append((start, end))
+    # Merge overlapping/adjacent spans so each page appears once, in order
+    spans.sort()
+    merged_spans: List[List[int]] = []
+    for start, end in spans:
+        if merged_spans and start <= merged_spans[-1][1] + 1:
+            merged_spans[-1][1] = max(merged_spans[-1][1], end)
+        else:
+            merged_spans.append([start, end])
+    return list(itertools.chain.from_iterable(range(a, b + 1) for a, b in merged_spans))
 
 def ensure_dirs(*dirs: Path) -> None:
     for d in dirs: d.mkdir(parents=True, exist_ok=True)
 
+# stdlib fallback: one encoder/decoder for every page instead of one per call
+_ENC = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+_DEC = json.JSONDecoder().decode
+
+def json_loads(raw: Any) -> Any:
+    """Parse JSON from str or bytes (orjson when available)."""
+    if orjson:
+        return orjson.loads(raw)
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode(json.detect_encoding(raw), "surrogatepass")
+    return _DEC(raw)
+
+def json_dumps_bytes(data: Any) -> bytes:
+    """UTF-8, 2-space indented JSON (orjson when available)."""
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return _ENC(data).encode("utf-8")
+
+# Leading code fence with optional language tag; the body runs to the next fence (or the end)
+_FENCE_RE = re.compile(r"```[\w-]*[ \t]*\n?(.*?)(?:```|\Z)", re.S)
+
 def json_strip_fences(text: str) -> str:
     t = (text or "").strip()
-    if not t: return t
-    if t.startswith("```"):
-        t = t.strip("`").split("\n", 1)[-1]
-        if not (t.strip().startswith("{") or t.strip().startswith("[")):
-            parts = t.split("```"); t = max(parts, key=len)
-    return t
+    if not t.startswith("```"):  # common case: response_mime_type was honoured
+        return t
+    return _FENCE_RE.match(t).group(1)
 
 def parse_page_json(text: str) -> List[dict]:
     t = json_strip_fences(text)
-    data = json.loads(t)
+    data = json_loads(t)
     if isinstance(data, dict): return [data]
     if not isinstance(data, list): raise ValueError("Model did not return a JSON array or object.")
     return data
 
 def read_prompt(prompt_path: Path) -> str:
     if prompt_path.exists():
-        t = prompt_path.read_text(encoding="utf-8").strip()
-        LOG.debug("Loaded prompt (%d chars) from %s", len(t), prompt_path)
-        return t
+        # keyed by mtime so an edited prompt file is picked up again
+        return _read_prompt_file(str(prompt_path), prompt_path.stat().st_mtime_ns)
     # Fallback prompt aligned to the new schema (safe quoting)
     return (
         '''Convert this Dewey Decimal Schedule page (or pages) into JSON for a linked database.
@@ -151,6 +183,18 @@ MULTI-PAGE CALLS
 '''
     )
 
+@functools.lru_cache(maxsize=8)
+def _read_prompt_file(path: str, mtime_ns: int) -> str:
+    t = Path(path).read_text(encoding="utf-8").strip()
+    LOG.debug("Loaded prompt (%d chars) from %s", len(t), path)
+    return t
+
+def schema_digest(schema: Optional[dict]) -> Optional[str]:
+    """sha256 of the canonical JSON form of the schema (None when no schema)."""
+    if not schema: return None
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
 
 # -------------------- provider adapters -----------------------
 class ProviderAdapter:
@@ -160,39 +204,102 @@ class ProviderAdapter:
     def init(self, **kwargs): ...
     def build_model(self, model_name: str, schema: Optional[dict], max_output_tokens: int): ...
     def make_file_part(self, path: Path) -> Any: ...
-    def generate_stream_or_text(self, msgs: list, stream: bool) -> str: ...
+    def generate_stream_or_text(self, msgs: list, stream: bool, on_delta=None) -> str: ...
 
 class StudioAdapter(ProviderAdapter):
+    # generation_config dicts keyed by (schema hash, max_output_tokens); reused on
+    # rebuilds (e.g. key rotation) instead of being reconstructed each time
+    _CFG_CACHE: Dict[Tuple[Optional[str], int], dict] = {}
+    UPLOAD_CACHE_SIZE = 512
+
     def __init__(self):
         super().__init__("studio")
         self.genai = None
+        self.api_key: Optional[str] = None
+        self.schema_hash: Optional[str] = None
+        self.schema: Optional[dict] = None
+        # (api key, resolved path, mtime_ns) -> uploaded file handle, LRU order.
+        # Uploads belong to the key's project, so rotation starts a fresh set.
+        self._uploads: "OrderedDict[Tuple[Optional[str], str, int], Any]" = OrderedDict()
+        self._uploads_lock = threading.Lock()  # calls run in worker threads
+        # (api key, model name, config key) -> GenerativeModel. A model binds the
+        # client of the key configured when it first runs, so rotating back to a
+        # key reuses its model instead of building a new one.
+        self._models: Dict[Tuple[Optional[str], str, Tuple[Optional[str], int]], Any] = {}
+    def set_schema(self, schema: Optional[dict]) -> None:
+        """Attach the parsed response schema once; build_model reuses it by hash."""
+        self.schema = schema
+        self.schema_hash = schema_digest(schema)
     def init(self, api_key: str, **kwargs):
         import google.generativeai as genai
         self.genai = genai
         genai.configure(api_key=api_key)
+        self.api_key = api_key
     def reconfigure(self, api_key: str):
         """Reconfigure underlying client with a new API key (for rotation)."""
         if self.genai is None:
             import google.generativeai as genai
             self.genai = genai
         self.genai.configure(api_key=api_key)
+        self.api_key = api_key
     def build_model(self, model_name: str, schema: Optional[dict], max_output_tokens: int):
-        cfg = {
-            "response_mime_type": "application/json",
-            "temperature": 0, "top_p": 0, "top_k": 1, "candidate_count": 1,
-            "max_output_tokens": max_output_tokens,
-        }
-        if schema: cfg["response_schema"] = schema
-        import google.generativeai as genai
-        self.model = genai.GenerativeModel(model_name=model_name, generation_config=cfg, system_instruction=None)
-    @retry(reraise=True, stop=stop_after_attempt(5),
-           wait=wait_exponential(multiplier=1, min=1, max=16),
-           retry=retry_if_exception_type(Exception),
-           before=before_log(LOG, logging.DEBUG), after=after_log(LOG, logging.DEBUG),
-           before_sleep=before_sleep_log(LOG, logging.WARNING))
+        if schema is not self.schema:
+            self.set_schema(schema)
+        key = (self.schema_hash, max_output_tokens)
+        cfg = self._CFG_CACHE.get(key)
+        if cfg is None:
+            cfg = {
+                "response_mime_type": "application/json",
+                "temperature": 0, "top_p": 0, "top_k": 1, "candidate_count": 1,
+                "max_output_tokens": max_output_tokens,
+            }
+            if schema: cfg["response_schema"] = schema
+            self._CFG_CACHE[key] = cfg
+        model_key = (self.api_key, model_name, key)
+        model = self._models.get(model_key)
+        if model is None:
+            import google.generativeai as genai
+            model = self._models[model_key] = genai.GenerativeModel(model_name=model_name, generation_config=cfg, system_instruction=None)
+        self.model = model
+    UPLOAD_ATTEMPTS = 5
+    def _upload(self, path: Path):
+        """upload_file with jittered exponential backoff (1s, 2s, 4s, 8s; capped at 16s)."""
+        for attempt in range(self.UPLOAD_ATTEMPTS):
+            try:
+                return self.genai.upload_file(path=path.as_posix())
+            except Exception as e:
+                if attempt + 1 >= self.UPLOAD_ATTEMPTS:
+                    raise
+                sleep_s = min(16.0, 2 ** attempt + random.random())
+                LOG.warning("Retrying upload of %s in %.1f seconds as it raised %s: %s.",
+                            path.name, sleep_s, type(e).__name__, e)
+                time.sleep(sleep_s)
+    def _upload_key(self, path: Path) -> Tuple[Optional[str], str, int]:
+        rp = path.resolve()
+        return (self.api_key, str(rp), rp.stat().st_mtime_ns)
     def make_file_part(self, path: Path):
-        return self.genai.upload_file(path=path.as_posix())
-    def generate_stream_or_text(self, msgs: list, stream: bool) -> str:
+        """Upload an image once; retries and dual calls reuse the handle."""
+        key = self._upload_key(path)
+        with self._uploads_lock:
+            part = self._uploads.get(key)
+            if part is not None:
+                self._uploads.move_to_end(key)
+                return part
+        part = self._upload(path)
+        with self._uploads_lock:
+            self._uploads[key] = part
+            if len(self._uploads) > self.UPLOAD_CACHE_SIZE:
+                self._uploads.popitem(last=False)
+        return part
+    def forget_upload(self, path: Path) -> None:
+        """Drop a cached upload (e.g. expired server-side) so the next call re-uploads."""
+        try:
+            key = self._upload_key(path)
+        except OSError:
+            return
+        with self._uploads_lock:
+            self._uploads.pop(key, None)
+    def generate_stream_or_text(self, msgs: list, stream: bool, on_delta=None) -> str:
         if stream:
             acc: List[str] = []
             s = self.model.generate_content(msgs, stream=True, request_options={"timeout": 600})
@@ -200,6 +307,7 @@ class StudioAdapter(ProviderAdapter):
                 delta = getattr(ch, "text", "") or ""
                 if delta:
                     acc.append(delta); sys.stdout.write(delta); sys.stdout.flush()
+                    if on_delta: on_delta(delta)
             return "".join(acc)
         else:
             resp = self.model.generate_content(msgs, request_options={"timeout": 600})
@@ -208,10 +316,16 @@ class StudioAdapter(ProviderAdapter):
 """Vertex adapter removed."""
 
 # -------------------- robust API key load (Studio) -------------
+def _load_dotenv() -> None:
+    try:
+        from dotenv import load_dotenv  # optional
+    except Exception:
+        return
+    try: load_dotenv()
+    except Exception: pass
+
 def load_api_key(cli_key: Optional[str]) -> str:
-    if load_dotenv:
-        try: load_dotenv()
-        except Exception: pass
+    _load_dotenv()
     api_key = cli_key or os.getenv("GOOGLE_API_KEY")
     if not api_key:
         key_file = Path("key.txt")
@@ -253,17 +367,32 @@ def load_api_key_pool(primary: Optional[str]) -> List[str]:
     return dedup
 
 # -------------------- cached images ---------------------------
+def pdf_page_count(pdf_path: Path) -> Optional[int]:
+    """Page count via PyMuPDF (optional; only used for page-range validation)."""
+    try:
+        import fitz  # PyMuPDF
+    except Exception:
+        return None
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        LOG.warning("Could not read page count from PDF; skipping strict validation.")
+        return None
+
 def build_expected_name(pdf_stem: str, page_number: int) -> str:
     return f"{pdf_stem}_p{page_number:05d}.png"
 
 def collect_cached_images(pdf_stem: str, images_dir: Path, pages: List[int], strict_cache: bool) -> List[Path]:
     imgs: List[Path] = []
     missing: List[int] = []
+    # plain string paths + os.path.isfile; Path objects only for the result
+    images_dir_s = os.fspath(images_dir)
     for pg in pages:
-        p = images_dir / build_expected_name(pdf_stem, pg)
-        if p.exists(): imgs.append(p)
-        else:
-            missing.append(pg); imgs.append(p)
+        s = os.path.join(images_dir_s, build_expected_name(pdf_stem, pg))
+        if not os.path.isfile(s):
+            missing.append(pg)
+        imgs.append(Path(s))
     if missing and strict_cache:
         miss_list = ", ".join(str(x) for x in missing)
         raise SystemExit(
@@ -276,89 +405,252 @@ def collect_cached_images(pdf_stem: str, images_dir: Path, pages: List[int], str
 # -------------------- generation core -------------------------
 REQUIRED_KEYS = {"id", "type", "notation", "prefLabel", "page", "source"}
 
+CONCEPT_TYPE = "Concept"
+
+# Source of the per-object checks; _build_object_check() fills in the
+# constants and exec()s it once at import. The first condition accepts a
+# valid object in one expression; only objects failing it go through the
+# individual checks that produce the error messages.
+_VALIDATOR_SRC = """
+def _check(i, o, page_number, img_name, errs):
+    if (type(o) is dict and {has_keys} and o["type"] == {concept!r}
+            and type(o["prefLabel"]) is dict and type(o["prefLabel"].get("en")) is str
+            and type(o["page"]) is int and o["page"] == page_number
+            and type(o["source"]) is dict and o["source"].get("fileName") == img_name):
+        return
+    if not isinstance(o, dict):
+        errs.append(f"[{{i}}] not an object"); return
+
+    missing = [k for k in {required!r} if k not in o]
+    if missing:
+        errs.append(f"[{{i}}] missing keys: {{missing}}")
+
+    # type
+    if o.get("type") != {concept!r}:
+        errs.append(f"[{{i}}] type must be {concept!r}, got {{o.get('type')}}")
+
+    # prefLabel.en
+    pl = o.get("prefLabel")
+    if not (isinstance(pl, dict) and isinstance(pl.get("en"), str)):
+        errs.append(f"[{{i}}] prefLabel.en missing or not a string")
+
+    # page
+    pg = o.get("page")
+    if not isinstance(pg, int) or pg != page_number:
+        errs.append(f"[{{i}}] bad page: {{pg}} (expected {{page_number}})")
+
+    # source.fileName
+    src = o.get("source")
+    if not (isinstance(src, dict) and src.get("fileName") == img_name):
+        got = src.get("fileName") if isinstance(src, dict) else None
+        errs.append(f"[{{i}}] bad source.fileName: {{got}} (expected {{img_name}})")
+"""
+
+def _build_object_check():
+    """exec() _VALIDATOR_SRC into _check(i, o, page_number, img_name, errs)."""
+    required = tuple(sorted(REQUIRED_KEYS))
+    src = _VALIDATOR_SRC.format(
+        has_keys=" and ".join(f"{k!r} in o" for k in required),
+        required=required,
+        concept=CONCEPT_TYPE,
+    )
+    ns: Dict[str, Any] = {}
+    exec(compile(src, "<page_validator>", "exec"), ns)
+    return ns["_check"]
+
+_check_object = _build_object_check()
+
 def validate_page_objects(objs: List[dict], page_number: int, img_name: str) -> Tuple[bool, List[str]]:
-    errs: List[str] = []
     if not isinstance(objs, list):
         return False, ["Top-level JSON must be an array."]
+    errs: List[str] = []
     for i, o in enumerate(objs):
-        if not isinstance(o, dict):
-            errs.append(f"[{i}] not an object"); continue
+        _check_object(i, o, page_number, img_name, errs)
+    return not errs, errs
 
-        missing = REQUIRED_KEYS - set(o.keys())
-        if missing:
-            errs.append(f"[{i}] missing keys: {sorted(missing)}")
-
-        # type
-        if o.get("type") != "Concept":
-            errs.append(f"[{i}] type must be 'Concept', got {o.get('type')}")
-
-        # prefLabel.en
-        pl = o.get("prefLabel")
-        if not (isinstance(pl, dict) and isinstance(pl.get("en"), str)):
-            errs.append(f"[{i}] prefLabel.en missing or not a string")
-
-        # page
-        pg = o.get("page")
-        if not isinstance(pg, int) or pg != page_number:
-            errs.append(f"[{i}] bad page: {pg} (expected {page_number})")
-
-        # source.fileName
-        src = o.get("source")
-        if not (isinstance(src, dict) and src.get("fileName") == img_name):
-            got = src.get("fileName") if isinstance(src, dict) else None
-            errs.append(f"[{i}] bad source.fileName: {got} (expected {img_name})")
-
-    return (len(errs) == 0), errs
-
-def apply_continuation_if_any(page_objs: List[dict], merged: List[dict]) -> List[dict]:
+def split_continuation(page_objs: List[dict]) -> Tuple[List[dict], List[Any]]:
+    """Drop a leading continuation sentinel; returns (page_objs, its scope.notes)."""
     if not page_objs:
-        return page_objs
+        return page_objs, []
     first = page_objs[0]
-    if isinstance(first, dict) and first.get("id") == "__CONT__" and first.get("notation") == "__CONT__":
-        scope = first.get("scope") or {}
-        cont_notes = []
-        if isinstance(scope, dict):
-            notes_val = scope.get("notes")
-            if isinstance(notes_val, list):
-                cont_notes = notes_val
-        if cont_notes:
-            for i in range(len(merged) - 1, -1, -1):
-                if merged[i].get("id") in ("__CONT__", "__PAGE__"):
-                    continue
-                tgt_scope = merged[i].setdefault("scope", {})
-                if not isinstance(tgt_scope, dict):
-                    tgt_scope = {}
-                    merged[i]["scope"] = tgt_scope
-                notes = tgt_scope.setdefault("notes", [])
-                if isinstance(notes, list):
-                    notes.extend(cont_notes)
-                else:
-                    tgt_scope["notes"] = cont_notes
-                break
-        return page_objs[1:]
-    return page_objs
+    if type(first) is dict and first.get("id") == "__CONT__" and first.get("notation") == "__CONT__":
+        scope = first.get("scope")
+        notes_val = scope.get("notes") if type(scope) is dict else None
+        return page_objs[1:], notes_val if type(notes_val) is list else []
+    return page_objs, []
+
+def merge_continuation(cont_notes: List[Any], merged: List[dict]) -> bool:
+    """Append continuation notes to the last real concept in merged; False if it has none."""
+    if not cont_notes:
+        return True
+    for tgt in reversed(merged):
+        if tgt.get("id") in ("__CONT__", "__PAGE__"):
+            continue
+        tgt_scope = tgt.setdefault("scope", {})
+        if type(tgt_scope) is not dict:
+            tgt_scope = {}
+            tgt["scope"] = tgt_scope
+        notes = tgt_scope.setdefault("notes", [])
+        if isinstance(notes, list):
+            notes.extend(cont_notes)
+        else:
+            tgt_scope["notes"] = cont_notes
+        return True
+    return False
+
+def merge_continuation_into_buckets(cont_notes: List[Any], page_buckets: Dict[int, List[dict]],
+                                    bucket_pages: List[int], page_number: int) -> None:
+    """merge_continuation against the nearest earlier page that has a real concept.
+
+    bucket_pages is the sorted list of page_buckets' keys."""
+    if not cont_notes:
+        return
+    for i in range(bisect_left(bucket_pages, page_number) - 1, -1, -1):
+        if merge_continuation(cont_notes, page_buckets[bucket_pages[i]]):
+            return
+
+def intern_common_fields(objs: List[Any]) -> None:
+    """Share one copy of values repeated in every object (type, skos.inScheme, source.fileName)."""
+    intern = sys.intern
+    for o in objs:
+        if type(o) is not dict:
+            continue
+        t = o.get("type")
+        if type(t) is str:
+            o["type"] = intern(t)
+        sk = o.get("skos")
+        if type(sk) is dict and type(sk.get("inScheme")) is str:
+            sk["inScheme"] = intern(sk["inScheme"])
+        src = o.get("source")
+        if type(src) is dict and type(src.get("fileName")) is str:
+            src["fileName"] = intern(src["fileName"])
 
 def split_objects_by_page(objs: List[dict]) -> Dict[int, List[dict]]:
     """Group objects by their 'page' integer."""
-    by_pg: Dict[int, List[dict]] = {}
+    by_pg: Dict[int, List[dict]] = defaultdict(list)
     for o in objs:
-        if not isinstance(o, dict):
+        # exact type checks: model output is plain JSON, never subclasses
+        if type(o) is not dict:
             continue
         pg_val = o.get("page")
-        if isinstance(pg_val, int):
-            by_pg.setdefault(pg_val, []).append(o)
+        if type(pg_val) is int:
+            by_pg[pg_val].append(o)
         else:
             LOG.debug("Discard object lacking valid page: %s", o)
     return by_pg
 
+_RETRY_AFTER_RE = re.compile(r"retry (?:in|after) (\d+(?:\.\d+)?)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.I)
+_AUTH_ERROR_TOKENS = ("permission", "unauthorized", "apikey", "api key", "403")
+_THROTTLE_ERROR_TOKENS = ("quota", "429", "resource exhausted", "resource has been exhausted", "rate limit")
+
+def retry_after_seconds(err: BaseException) -> Optional[float]:
+    """Server-suggested wait from a Retry-After header or the error text, if any."""
+    headers = getattr(getattr(err, "response", None), "headers", None)
+    if headers:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    m = _RETRY_AFTER_RE.search(str(err))
+    return float(m.group(1) or m.group(2)) if m else None
+
+# Published per-key quotas used when --rpm/--tpm are not given: model -> (rpm, tpm)
+MODEL_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "gemini-1.5-pro": (360, 4_000_000),
+}
+IMAGE_TILE_PX = 768
+IMAGE_TILE_TOKENS = 258  # Gemini bills images per 768x768 tile
+
+def image_token_estimate(path: Path) -> int:
+    """Input tokens for one image: tiles from the PNG header, one tile if unknown."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(24)
+    except OSError:
+        return IMAGE_TILE_TOKENS
+    if head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        return IMAGE_TILE_TOKENS
+    w, h = int.from_bytes(head[16:20], "big"), int.from_bytes(head[20:24], "big")
+    return IMAGE_TILE_TOKENS * max(1, -(-w // IMAGE_TILE_PX)) * max(1, -(-h // IMAGE_TILE_PX))
+
+def estimate_request_tokens(prompt: str, images: List[Path]) -> int:
+    """Rough input-token cost of one call (~4 characters per text token)."""
+    return len(prompt) // 4 + sum(image_token_estimate(p) for p in images)
+
+class KeyBucket:
+    """Admission control for one API key.
+
+    At most `limit` calls in flight, and `rpm` calls / `tpm` estimated input
+    tokens per rolling 60s window (<= 0: no limit). `limit` is AIMD-controlled between 1 and
+    max_concurrent: halved on each throttling error, +0.5 per successful call.
+    A key that was throttled with a retry hint, or rotated away from, is
+    "cooling" until then; rotation prefers keys that are not."""
+    COOL_DOWN_S = 30.0
+    WINDOW_S = 60.0
+    ROTATE_AFTER = 3  # throttling errors in a row, within WINDOW_S, before rotating away
+
+    def __init__(self, rpm: float, max_concurrent: int, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrent = max_concurrent
+        self.limit = float(max_concurrent)
+        self.in_flight = 0
+        self.slots = asyncio.Condition()
+        self.window: deque = deque()  # (monotonic start time, estimated tokens) of recent calls
+        self.window_tokens = 0
+        self.strikes: deque = deque()  # monotonic times of throttling errors since the last success
+        self.cooling_until = 0.0
+        self.lock = asyncio.Lock()
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooling_until
+    def cool_down(self, seconds: Optional[float] = None) -> None:
+        until = time.monotonic() + (self.COOL_DOWN_S if seconds is None else seconds)
+        self.cooling_until = max(self.cooling_until, until)
+    async def acquire(self, est_tokens: int = 0) -> None:
+        """Wait until a call costing ~est_tokens fits every limit, then claim it."""
+        async with self.slots:
+            await self.slots.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.cooling_until:
+                    await asyncio.sleep(self.cooling_until - now); continue
+                while self.window and now - self.window[0][0] >= self.WINDOW_S:
+                    self.window_tokens -= self.window.popleft()[1]
+                rpm_ok = self.rpm <= 0 or len(self.window) < self.rpm
+                # a single call above the whole budget still goes once the window is empty
+                tpm_ok = self.tpm <= 0 or not self.window or self.window_tokens + est_tokens <= self.tpm
+                if rpm_ok and tpm_ok:
+                    self.window.append((now, est_tokens))
+                    self.window_tokens += est_tokens
+                    return
+                await asyncio.sleep(self.WINDOW_S - (now - self.window[0][0]))
+    async def release(self) -> None:
+        async with self.slots:
+            self.in_flight -= 1
+            self.slots.notify_all()
+    def on_success(self) -> None:
+        self.limit = min(float(self.max_concurrent), self.limit + 0.5)
+        self.strikes.clear()
+    def on_throttle(self, retry_after: Optional[float] = None) -> bool:
+        """Record a throttling error; True once the key should be rotated away from."""
+        now = time.monotonic()
+        self.limit = max(1.0, self.limit * 0.5)
+        if retry_after:
+            self.cool_down(retry_after)
+        self.strikes.append(now)
+        while now - self.strikes[0] >= self.WINDOW_S:
+            self.strikes.popleft()
+        return len(self.strikes) >= self.ROTATE_AFTER
+
 # -------- Page lead sentinel capture (sidecar) -----------------
 def is_page_lead_sentinel(obj: dict, page_number: int, img_name: str) -> bool:
-    if not isinstance(obj, dict): return False
-    if obj.get("id") != "__PAGE__" or obj.get("notation") != "__PAGE__": return False
-    if obj.get("type") != "Concept": return False
+    if type(obj) is not dict or obj.get("id") != "__PAGE__": return False
+    if obj.get("notation") != "__PAGE__" or obj.get("type") != CONCEPT_TYPE: return False
     if obj.get("page") != page_number: return False
-    src = obj.get("source", {})
-    return isinstance(src, dict) and src.get("fileName") == img_name
+    src = obj.get("source")
+    return type(src) is dict and src.get("fileName") == img_name
 
 def apply_page_lead_if_any(page_objs: List[dict], page_number: int, img_name: str, page_leads: Dict[int, dict]) -> List[dict]:
     """If first object is a page-lead sentinel, stash it in page_leads and drop it.
@@ -373,114 +665,161 @@ def apply_page_lead_if_any(page_objs: List[dict], page_number: int, img_name: st
         return page_objs[1:]
     return page_objs
 
-def _strip_hierarchy(page_objs: List[dict]) -> List[dict]:
-    """Remove optional 'hierarchy' field from each concept object, in-place safe."""
-    for o in page_objs:
-        if isinstance(o, dict):
-            o.pop("hierarchy", None)
-    return page_objs
-
-def route_scope_fields(objs: List[dict]) -> List[dict]:
-    """Move well-known lines from scope.notes[] into specific fields."""
-    import re
-    
-    # Simple phrase/regex-based router from scope.notes[] -> structured fields
-    ROUTE_PATTERNS = [
-        # ("target_field", compiled_regex, strip_prefix_in_capture?)
-        ("classHere", re.compile(r"^\s*class here[:\s-]*(.*)$", re.I), True),
-        ("including", re.compile(r"^\s*including[:\s-]*(.*)$", re.I), True),
-        ("seeAlso",  re.compile(r"^\s*(?:for .*?,\s*)?see\s+([0-9][0-9][0-9](?:\.[0-9]+)?)\s*\.?\s*$", re.I), False),
-        ("seeAlso",  re.compile(r"^\s*see also[:\s-]*(.*)$", re.I), True),
-        ("manualRefs", re.compile(r"^\s*see manual at[:\s-]*(.*)$", re.I), True),
-        ("tableRefs",  re.compile(r".*\btable\s+1\b.*", re.I), False),
-        ("addToBaseRules", re.compile(r"^\s*add to base .*", re.I), False),
-        ("relocations",   re.compile(r".*\brelocat(?:ed|ion)\b.*", re.I), False),
-        ("variantNameLabel", re.compile(r"^\s*variant name[:\s-]*(.*)$", re.I), True),
-    ]
-    
-    for o in objs:
-        if not isinstance(o, dict):
-            continue
-        sc = o.get("scope")
-        if not isinstance(sc, dict):
+# Router from scope.notes[] -> structured fields. The rules are tried in
+# order as one alternation; each alternative is a named group whose name maps
+# to (target field, name of the capture group to keep, or None to keep the
+# whole line).
+_ROUTE_RULES = [
+    ("classHere", "classHere", "classHere_v", r"\s*class here[:\s-]*(?P<classHere_v>.*)$"),
+    ("including", "including", "including_v", r"\s*including[:\s-]*(?P<including_v>.*)$"),
+    ("seeNum", "seeAlso", "seeNum_v", r"\s*(?:for .*?,\s*)?see\s+(?P<seeNum_v>[0-9][0-9][0-9](?:\.[0-9]+)?)\s*\.?\s*$"),
+    ("seeAlso", "seeAlso", "seeAlso_v", r"\s*see also[:\s-]*(?P<seeAlso_v>.*)$"),
+    ("manualRefs", "manualRefs", "manualRefs_v", r"\s*see manual at[:\s-]*(?P<manualRefs_v>.*)$"),
+    ("tableRefs", "tableRefs", None, r".*\btable\s+1\b.*"),
+    ("addToBaseRules", "addToBaseRules", None, r"\s*add to base .*"),
+    ("relocations", "relocations", None, r".*\brelocat(?:ed|ion)\b.*"),
+    ("variantNameLabel", "variantNameLabel", "variantNameLabel_v", r"\s*variant name[:\s-]*(?P<variantNameLabel_v>.*)$"),
+]
+_ROUTE_RE = re.compile("(?i)" + "|".join(f"(?P<{name}>{pat})" for name, _, _, pat in _ROUTE_RULES))
+_ROUTE_INDEX = {name: i for i, (name, _, _, _) in enumerate(_ROUTE_RULES)}
+
+def classify_line(raw: str) -> Tuple[int, str]:
+    """Index into _ROUTE_RULES of the first rule matching raw (-1 if none) and the value to store."""
+    m = _ROUTE_RE.match(raw)
+    if m is None:
+        return -1, raw
+    # the outer (rule) group closes last, so lastgroup names the rule
+    idx = _ROUTE_INDEX[m.lastgroup]
+    value_group = _ROUTE_RULES[idx][2]
+    return idx, (m.group(value_group).strip() if value_group else raw)
+
+def _route_scope(o: dict) -> None:
+    """Move well-known lines from one object's scope.notes[] into specific fields."""
+    sc = o.get("scope")
+    if not isinstance(sc, dict):
+        return
+
+    notes = sc.get("notes")
+    if not isinstance(notes, list) or not notes:
+        return
+
+    remaining: List[str] = []
+    # ensure target arrays exist when first needed
+    def _push(key: str, val: str):
+        arr = sc.get(key)
+        if not isinstance(arr, list):
+            sc[key] = arr = []
+        if val and val not in arr:
+            arr.append(val)
+
+    std_subdiv = False
+
+    for line in notes:
+        if not isinstance(line, str):
             continue
+        raw = line.strip()
+        low = raw.lower()
 
-        notes = sc.get("notes")
-        if not isinstance(notes, list) or not notes:
-            continue
-
-        remaining: List[str] = []
-        # ensure target arrays exist when first needed
-        def _push(key: str, val: str):
-            arr = sc.get(key)
-            if not isinstance(arr, list):
-                sc[key] = arr = []
-            if val and val not in arr:
-                arr.append(val)
+        # quick signals for standard subdivisions
+        if "standard subdivisions" in low or "use notation 019 from table 1" in low:
+            std_subdiv = True
 
-        std_subdiv = False
+        idx, value = classify_line(raw)
+        if idx < 0:
+            remaining.append(raw)
+        else:
+            _push(_ROUTE_RULES[idx][1], value)
 
-        for line in notes:
-            if not isinstance(line, str):
-                continue
-            raw = line.strip()
-            low = raw.lower()
-
-            # quick signals for standard subdivisions
-            if "standard subdivisions" in low or "use notation 019 from table 1" in low:
-                std_subdiv = True
-
-            routed = False
-            for target, pat, capture_after in ROUTE_PATTERNS:
-                m = pat.match(raw)
-                if m:
-                    if target in ("tableRefs", "addToBaseRules", "relocations"):
-                        _push(target, raw)  # keep full line for these
-                    elif target == "seeAlso" and m.lastindex:
-                        _push(target, m.group(1).strip())
-                    elif m.lastindex and capture_after:
-                        _push(target, m.group(1).strip())
-                    else:
-                        _push(target, raw)
-                    routed = True
-                    break
+    # write back remaining notes
+    if remaining:
+        sc["notes"] = remaining
+    else:
+        # drop empty notes array
+        sc.pop("notes", None)
 
-            if not routed:
-                remaining.append(raw)
+    # set boolean only if explicitly indicated
+    if std_subdiv:
+        sc["standardSubdivisions"] = True
 
-        # write back remaining notes
-        if remaining:
-            sc["notes"] = remaining
-        else:
-            # drop empty notes array
-            sc.pop("notes", None)
+def postprocess_page(page_objs: List[dict], page_number: int, img_name: str) -> Tuple[bool, List[str]]:
+    """Route scope notes, drop the optional 'hierarchy' field and validate, in one pass over the page."""
+    errs: List[str] = []
+    for i, o in enumerate(page_objs):
+        if isinstance(o, dict):
+            _route_scope(o)
+            o.pop("hierarchy", None)
+        _check_object(i, o, page_number, img_name, errs)
+    return not errs, errs
+
+# Per-call page hints appended to the prompt
+_PAGE_HINT_FMT = (
+    "\nPage context:\n"
+    " - page (page number) to set: {pg}\n"
+    " - source.fileName (image file name): {name}\n"
+    "Ensure every object includes page and source.fileName accordingly.\n"
+)
+_DUAL_PAGE_HINT_FMT = (
+    "\nPages context (dual call):\n"
+    " - Page A: page={pg1}, source.fileName={name1}\n"
+    " - Page B: page={pg2}, source.fileName={name2}\n"
+    "Return a SINGLE JSON array for BOTH pages. Each object MUST set the correct page and source.fileName. If page B begins with a continuation, still emit the continuation sentinel first for that page.\n"
+)
 
-        # set boolean only if explicitly indicated
-        if std_subdiv:
-            sc["standardSubdivisions"] = True
+class StreamingArrayParser:
+    """Parse a streamed top-level JSON array item by item with ijson (optional).
 
-    return objs
+    feed() takes text deltas as they arrive; finish() returns the items, or None
+    when the full text must be parsed instead (no ijson, fenced output, a
+    top-level object, or a parse error)."""
+    def __init__(self):
+        self.objs: List[Any] = []
+        self.failed = ijson is None
+        self._events = None
+        self._coro = None
+    def feed(self, delta: str) -> None:
+        if self.failed:
+            return
+        if self._coro is None:
+            head = delta.lstrip()
+            if not head:
+                return
+            if head[0] != "[":
+                self.failed = True
+                return
+            self._events = ijson.sendable_list()
+            self._coro = ijson.items_coro(self._events, "item", use_float=True)
+        try:
+            self._coro.send(delta.encode("utf-8"))
+        except Exception:
+            self.failed = True
+            return
+        if self._events:
+            self.objs.extend(self._events)
+            del self._events[:]
+    def finish(self) -> Optional[List[Any]]:
+        if self.failed or self._coro is None:
+            return None
+        try:
+            self._coro.close()
+        except Exception:
+            return None
+        self.objs.extend(self._events)
+        return self.objs
 
-def stream_or_generate_json(adapter, prompt: str, img_path: Path, page_number: int, stream: bool, show_prompt: bool=False) -> str:
-    page_hint = (
-        f"\nPage context:\n"
-        f" - page (page number) to set: {page_number}\n"
-        f" - source.fileName (image file name): {img_path.name}\n"
-        f"Ensure every object includes page and source.fileName accordingly.\n"
-    )
-    full_prompt = prompt + page_hint
+def stream_or_generate_json(adapter, prompt: str, img_path: Path, page_number: int, stream: bool, show_prompt: bool=False, on_delta=None) -> str:
+    full_prompt = prompt + _PAGE_HINT_FMT.format(pg=page_number, name=img_path.name)
     if show_prompt:
         LOG.info("\n===== PROMPT (page %d) =====\n%s\n============================", page_number, full_prompt)
     file_part = adapter.make_file_part(img_path)
     msgs = [{"role": "user", "parts": [{"text": full_prompt}, file_part]}]
     if stream:
         sys.stdout.write(f"\n--- streaming page {page_number} ---\n"); sys.stdout.flush()
-    text = adapter.generate_stream_or_text(msgs, stream=stream)
+    text = adapter.generate_stream_or_text(msgs, stream=stream, on_delta=on_delta)
     if stream:
         sys.stdout.write("\n--- end stream ---\n"); sys.stdout.flush()
     return text
 
-def stream_or_generate_json_dual(adapter, prompt: str, img_path1: Path, page_number1: int, img_path2: Path, page_number2: int, stream: bool, show_prompt: bool=False) -> str:
+def stream_or_generate_json_dual(adapter, prompt: str, img_path1: Path, page_number1: int, img_path2: Path, page_number2: int, stream: bool, show_prompt: bool=False, on_delta=None) -> str:
     """Send TWO consecutive page images in one request.
 
     The prompt is augmented with explicit instructions that BOTH pages are provided and all
@@ -488,13 +827,8 @@ def stream_or_generate_json_dual(adapter, prompt: str, img_path1: Path, page_num
     Model must still return a single JSON array (or object) which we will parse then split
     by page number.
     """
-    page_hint = (
-        f"\nPages context (dual call):\n"
-        f" - Page A: page={page_number1}, source.fileName={img_path1.name}\n"
-        f" - Page B: page={page_number2}, source.fileName={img_path2.name}\n"
-        f"Return a SINGLE JSON array for BOTH pages. Each object MUST set the correct page and source.fileName. If page B begins with a continuation, still emit the continuation sentinel first for that page.\n"
-    )
-    full_prompt = prompt + page_hint
+    full_prompt = prompt + _DUAL_PAGE_HINT_FMT.format(pg1=page_number1, name1=img_path1.name,
+                                                      pg2=page_number2, name2=img_path2.name)
     if show_prompt:
         LOG.info("\n===== PROMPT (pages %d+%d) =====\n%s\n================================", page_number1, page_number2, full_prompt)
     file_part1 = adapter.make_file_part(img_path1)
@@ -502,7 +836,7 @@ def stream_or_generate_json_dual(adapter, prompt: str, img_path1: Path, page_num
     msgs = [{"role": "user", "parts": [{"text": full_prompt}, file_part1, file_part2]}]
     if stream:
         sys.stdout.write(f"\n--- streaming pages {page_number1}+{page_number2} ---\n"); sys.stdout.flush()
-    text = adapter.generate_stream_or_text(msgs, stream=stream)
+    text = adapter.generate_stream_or_text(msgs, stream=stream, on_delta=on_delta)
     if stream:
         sys.stdout.write("\n--- end stream ---\n"); sys.stdout.flush()
     return text
@@ -511,18 +845,146 @@ def stream_or_generate_json_dual(adapter, prompt: str, img_path1: Path, page_num
 def page_json_path(jsons_dir: Path, pdf_stem: str, page_number: int) -> Path:
     return jsons_dir / f"{pdf_stem}_p{page_number:05d}.json"
 
-def write_atomic_json(path: Path, data: Any) -> None:
+@dataclass(slots=True, frozen=True)
+class PageSpec:
+    """A selected page: number, cached image and checkpoint path (built once per run)."""
+    pg: int
+    img: Path
+    chk: Path
+
+def _fsync_dir(path: Path) -> None:
+    """fsync a directory so a rename inside it survives a crash (no-op where unsupported)."""
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # SMB/NFS mounts and Windows refuse fsync on directories
+        if e.errno not in (errno.ENOTSUP, errno.EINVAL, errno.EBADF, errno.EACCES):
+            raise
+    finally:
+        os.close(fd)
+
+def write_atomic_json(path: Path, data: Any, durable: bool = False) -> None:
+    """Write JSON via a temp file and rename. durable=True also fsyncs the file and its directory."""
     tmp = path.with_suffix(path.suffix + ".part")
     path.parent.mkdir(parents=True, exist_ok=True)
-    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    if durable:
+        with open(tmp, "wb") as f:
+            f.write(json_dumps_bytes(data))
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        tmp.write_bytes(json_dumps_bytes(data))
     os.replace(tmp, path)  # atomic on POSIX; safe on Windows if same volume
+    if durable:
+        _fsync_dir(path.parent)
+
+def write_atomic_json_array(path: Path, parts: Iterable[List[Any]], durable: bool = False) -> int:
+    """Stream the concatenation of parts to path as one JSON array; returns the object count.
+
+    Produces the same bytes as write_atomic_json on the concatenated list, but
+    serializes one object at a time instead of the whole array at once."""
+    tmp = path.with_suffix(path.suffix + ".part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(tmp, "wb") as f:
+        for obj in itertools.chain.from_iterable(parts):
+            f.write(b",\n  " if n else b"[\n  ")
+            # re-indent one level; raw newlines never occur inside JSON strings
+            f.write(json_dumps_bytes(obj).replace(b"\n", b"\n  "))
+            n += 1
+        f.write(b"\n]" if n else b"[]")
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if durable:
+        _fsync_dir(path.parent)
+    return n
+
+# Checkpoint and raw-output writes get their own threads: the default executor
+# is sized for the blocking model calls and would queue writes behind them
+_IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chkpt")
+
+async def write_atomic_bytes_async(path: Path, payload: bytes) -> None:
+    """Async counterpart of write_atomic_json for an already serialized payload."""
+    loop = asyncio.get_running_loop()
+    tmp = path.with_suffix(path.suffix + ".part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if aiofiles:
+        async with aiofiles.open(tmp, "wb", executor=_IO_POOL) as f:
+            await f.write(payload)
+    else:
+        await loop.run_in_executor(_IO_POOL, tmp.write_bytes, payload)
+    await loop.run_in_executor(_IO_POOL, os.replace, tmp, path)
+
+def _write_raw_text(path: Path, text: str) -> None:
+    try:
+        path.write_text(text, encoding='utf-8')
+    except Exception as e:
+        LOG.warning("Could not write raw output file: %s", e)
+
+class CheckpointWriter:
+    """Batches atomic checkpoint writes: submit() starts a write, flush() waits for the batch.
+
+    Callers flush before listing pages in the manifest, so the manifest never
+    names a checkpoint that is not on disk yet."""
+
+    def __init__(self, batch_pages: int = 1):
+        self.batch_pages = max(1, batch_pages)
+        self._pending: List["asyncio.Future[None]"] = []
+        self._pages = 0
+
+    def submit(self, path: Path, payload: bytes) -> None:
+        self._pending.append(asyncio.ensure_future(write_atomic_bytes_async(path, payload)))
+        self._pages += 1
+
+    def submit_raw(self, path: Path, text: str) -> None:
+        """Write a --save_raw dump in the background; failures are only logged."""
+        loop = asyncio.get_running_loop()
+        self._pending.append(loop.run_in_executor(_IO_POOL, _write_raw_text, path, text))
+
+    @property
+    def due(self) -> bool:
+        return self._pages >= self.batch_pages
+
+    async def flush(self) -> int:
+        pending, self._pending = self._pending, []
+        pages, self._pages = self._pages, 0
+        await asyncio.gather(*pending)
+        return pages
+
+def _scan_checkpoints(jsons_dir: Path, pdf_stem: str) -> Dict[int, Tuple[Path, int]]:
+    """Map page number -> (checkpoint path, mtime_ns) with one directory scan (empty files skipped)."""
+    found: Dict[int, Tuple[Path, int]] = {}
+    try:
+        with os.scandir(jsons_dir) as it:
+            for de in it:
+                # "<stem>_p<5+ digits>.json", checked with string ops instead of a regex
+                name = de.name
+                if not name.endswith(".json"):
+                    continue
+                stem, sep, digits = name[:-5].rpartition("_p")
+                if not sep or stem != pdf_stem or len(digits) < 5 or not digits.isdecimal():
+                    continue
+                if de.is_file():
+                    st = de.stat()
+                    if st.st_size > 0:
+                        found[int(digits)] = (Path(de.path), st.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return found
 
 def try_load_existing_page(path: Path) -> Optional[List[dict]]:
     if not path.exists(): return None
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
+        data = json_loads(path.read_bytes())
         if isinstance(data, dict): data = [data]
         if not isinstance(data, list): return None
+        intern_common_fields(data)
         return data
     except Exception:
         return None
@@ -536,13 +998,25 @@ def existing_is_valid_for_page(data: List[dict], page_number: int, img_name: str
 def load_manifest(manifest_path: Path) -> Dict[str, Any]:
     if manifest_path.exists():
         try:
-            return json.loads(manifest_path.read_text(encoding="utf-8"))
+            return json_loads(manifest_path.read_bytes())
         except Exception:
             pass
     return {"processed_pages": [], "updated_at": None}
 
-def save_manifest(manifest_path: Path, processed_pages: List[int]) -> None:
-    write_atomic_json(manifest_path, {"processed_pages": processed_pages, "updated_at": int(time.time())})
+def save_manifest(manifest_path: Path, processed_pages: List[int],
+                  validated_version: Optional[str] = None, validated_pages: Optional[List[int]] = None) -> None:
+    data: Dict[str, Any] = {"processed_pages": processed_pages, "updated_at": int(time.time())}
+    if validated_version:
+        data["validated_version"] = validated_version
+        data["validated_pages"] = validated_pages or []
+    write_atomic_json(manifest_path, data)
+
+def validation_version(schema_hash: Optional[str]) -> str:
+    """Stamp for checkpoints validated by this code (and response schema).
+
+    Pages listed under it in the manifest are not revalidated on resume."""
+    code = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()[:8]
+    return f"{code}:{(schema_hash or '-')[:16]}"
 
 # --------------------------- main -----------------------------
 def main():
@@ -560,13 +1034,17 @@ def main():
     ap.add_argument("--max_output_tokens", type=int, default=32768)
     ap.add_argument("--max_attempts", type=int, default=4)
     ap.add_argument("--retry_backoff", type=float, default=2.0)
-    ap.add_argument("--stream", action="store_true")
+    ap.add_argument("--stream", action="store_true", help="Echo model output to stdout as it arrives (forces --parallel 1).")
     ap.add_argument("--pages_per_call", type=int, choices=[1,2], default=1, help="Process 1 page per model call (default) or 2 consecutive pages together.")
     ap.add_argument("--show_prompt", action="store_true", help="Print the full prompt (including page hints) before each call.")
     ap.add_argument("--save_raw", action="store_true", help="Save raw model output text beside checkpoints as *.raw.txt for inspection.")
     ap.add_argument("--page_leads", action="store_true",
                     help="Capture ANY non-DDC top-of-page block via __PAGE__ sentinel into a sidecar file.")
     ap.add_argument("--force", action="store_true", help="Reprocess pages even if a valid checkpoint exists.")
+    ap.add_argument("--parallel", type=int, default=1, help="Model calls in flight at once (results are still committed in page order).")
+    ap.add_argument("--checkpoint_batch", type=int, default=1, help="Checkpoint writes to batch before each manifest update (default: every call).")
+    ap.add_argument("--rpm", type=float, default=None, help="Per-key request limit per rolling minute (0 = unlimited; default: known model quota, else unlimited).")
+    ap.add_argument("--tpm", type=int, default=None, help="Per-key estimated input-token limit per rolling minute (0 = unlimited; default as --rpm).")
     ap.add_argument("--verbose", action="store_true")
     ap.add_argument("--log_level", type=str, default=None)
     ap.add_argument("--strict_cache", action="store_true", default=True)
@@ -576,11 +1054,13 @@ def main():
     args = ap.parse_args()
 
     setup_logging(args.verbose, args.log_level)
+    if args.stream and args.parallel > 1:
+        # streamed deltas go straight to stdout; concurrent calls would interleave them
+        LOG.warning("--stream echoes each response as it arrives; running with --parallel 1 instead of %d.", args.parallel)
+        args.parallel = 1
 
     # Provider init (studio only)
-    if load_dotenv:
-        try: load_dotenv()
-        except Exception: pass
+    _load_dotenv()
     # API key rotation pool
     api_keys = load_api_key_pool(args.api_key)
     if not api_keys:
@@ -600,18 +1080,14 @@ def main():
         except Exception as e:
             LOG.warning("Failed to load schema (%s). Proceeding without response_schema.", e)
 
-    # Build model
+    # Build model (schema hashed once; rebuilds on key rotation reuse the config)
+    adapter.set_schema(schema)
     adapter.build_model(args.model, schema, args.max_output_tokens)
 
     # Page selection (PDF only for page count)
     if not args.pdf_path.exists(): raise SystemExit(f"PDF not found: {args.pdf_path}")
-    total = 9_999_999
-    if fitz:
-        try:
-            with fitz.open(args.pdf_path) as doc:
-                total = doc.page_count
-        except Exception:
-            LOG.warning("Could not read page count from PDF; skipping strict validation.")
+    total = pdf_page_count(args.pdf_path)
+    if total is None: total = 9_999_999
     pages = parse_pages_arg(args.pages, total)
     if not pages:
         LOG.warning("No pages selected."); return
@@ -630,118 +1106,144 @@ def main():
     # Resume state
     manifest = load_manifest(manifest_path)
     processed_pages: List[int] = list(manifest.get("processed_pages") or [])
-
-    merged: List[dict] = []
-
-    # First, if resuming, preload previously processed pages into 'merged' in order
-    for pg, img_path in zip(pages, img_paths):
-        chk = page_json_path(args.jsons_dir, pdf_stem, pg)
-        if chk.exists():
+    # Checkpoints validated by this same code/schema and not modified after the
+    # manifest was written can be loaded without revalidation
+    current_version = validation_version(adapter.schema_hash)
+    validated_pages = set()
+    manifest_mtime = -1
+    if manifest.get("validated_version") == current_version:
+        validated_pages = set(manifest.get("validated_pages") or [])
+        try:
+            manifest_mtime = manifest_path.stat().st_mtime_ns
+        except OSError:
+            validated_pages = set()
+
+    # Objects per page; the final output is the pages in order
+    page_buckets: Dict[int, List[dict]] = {}
+    bucket_pages: List[int] = []  # sorted keys of page_buckets
+
+    def set_bucket(pg: int, objs: List[dict]) -> None:
+        if pg not in page_buckets:
+            insort(bucket_pages, pg)
+        page_buckets[pg] = objs
+
+    page_specs = [PageSpec(pg, img, page_json_path(args.jsons_dir, pdf_stem, pg)) for pg, img in zip(pages, img_paths)]
+
+    # First, if resuming, preload previously processed pages
+    existing_map = _scan_checkpoints(args.jsons_dir, pdf_stem)
+    valid_pages = set()  # pages whose checkpoint loaded and validated
+    for spec in page_specs:
+        found = existing_map.get(spec.pg)
+        if found is not None:
+            chk, chk_mtime = found
             existing = try_load_existing_page(chk)
-            if existing and existing_is_valid_for_page(existing, pg, img_path.name):
+            trusted = spec.pg in validated_pages and chk_mtime <= manifest_mtime
+            if existing and (trusted or existing_is_valid_for_page(existing, spec.pg, spec.img.name)):
                 # Continuation sentinel should already be resolved in saved file,
-                # so just extend merged.
-                merged.extend(existing)
-                if pg not in processed_pages:
-                    processed_pages.append(pg)
+                # so just keep the objects.
+                set_bucket(spec.pg, existing)
+                valid_pages.add(spec.pg)
+                validated_pages.add(spec.pg)
+                if spec.pg not in processed_pages:
+                    processed_pages.append(spec.pg)
+                continue
+        validated_pages.discard(spec.pg)
 
     # Now run over pages; skip if valid checkpoint unless --force.
     # If pages_per_call == 2 we advance in steps of 2 combining consecutive pages.
-    i = 0
+    # Each remaining unit (1 or 2 PageSpecs) is one model call.
+    units: List[Tuple[PageSpec, ...]] = []
     # Storage for captured page lead sentinels (if enabled)
     page_leads: Dict[int, dict] = {}
 
-    while i < len(pages):
-        pg1 = pages[i]
-        img1 = img_paths[i]
-        pg2 = None; img2 = None
-        dual = (args.pages_per_call == 2 and i + 1 < len(pages))
-        if dual:
-            pg2 = pages[i+1]
-            img2 = img_paths[i+1]
-
-        # Helper to check single page skip condition
-        def checkpoint_valid(pg, img_path):
-            chk = page_json_path(args.jsons_dir, pdf_stem, pg)
-            existing = try_load_existing_page(chk)
-            return existing and existing_is_valid_for_page(existing, pg, img_path.name)
-
-        if dual:
-            # If BOTH pages already valid and not forcing, skip both
-            if (not args.force) and checkpoint_valid(pg1, img1) and checkpoint_valid(pg2, img2):
-                LOG.info("Skip pages %d & %d (valid checkpoints).", pg1, pg2)
-                i += 2
-                continue
-        else:
-            if (not args.force) and checkpoint_valid(pg1, img1):
-                LOG.info("Skip p%d (valid checkpoint).", pg1)
-                i += 1
-                continue
-
-        attempt = 0
-        success = False
-        last_err = None
-        while attempt < args.max_attempts and not success:
-            attempt += 1
-            try:
-                if dual:
-                    LOG.info("[STUDIO] Pages %d+%d attempt %d/%d", pg1, pg2, attempt, args.max_attempts)
-                    raw = stream_or_generate_json_dual(adapter, prompt, img1, pg1, img2, pg2, stream=args.stream, show_prompt=args.show_prompt)
-                else:
-                    LOG.info("[STUDIO] Page %d attempt %d/%d", pg1, attempt, args.max_attempts)
-                    raw = stream_or_generate_json(adapter, prompt, img1, pg1, stream=args.stream, show_prompt=args.show_prompt)
-                if not raw.strip():
-                    raise ValueError("Empty response from model")
-
-                objs = parse_page_json(raw)
-                by_pg = split_objects_by_page(objs)
-
-                # Build batch list for unified handling
-                batch = [(img1, pg1)] + ([(img2, pg2)] if dual else [])
-                ordered_objs: List[dict] = []
-
-                for img_path, pg in batch:
-                    page_objs = by_pg.get(pg, [])
-                    # (a) capture + remove page-lead sentinel (sidecar)
-                    if args.page_leads:
-                        page_objs = apply_page_lead_if_any(page_objs, pg, img_path.name, page_leads)
-                    # (b) continuation sentinel merge & drop
-                    page_objs = apply_continuation_if_any(page_objs, merged)
-
-                    # NEW: route well-known lines from notes -> structured scope fields
-                    page_objs = route_scope_fields(page_objs)
-
-                    # Optional hierarchy stripping before validation
-                    page_objs = _strip_hierarchy(page_objs)
-                    ok_pg, errs_pg = validate_page_objects(page_objs, pg, img_path.name)
-                    if not ok_pg and page_objs:
-                        raise ValueError(f"Per-page validation failed for p{pg}: " + " | ".join(errs_pg[:6]))
-
-                    chk_path = page_json_path(args.jsons_dir, pdf_stem, pg)
-                    if args.save_raw and pg == pg1:  # save once per call
-                        raw_path = chk_path.with_suffix('.raw.txt') if not dual else (chk_path.parent / f"{pdf_stem}_p{pg1:05d}_p{(pg2 or pg1):05d}.raw.txt")
-                        try:
-                            raw_path.write_text(raw, encoding='utf-8')
-                        except Exception as e:
-                            LOG.warning("Could not write raw output file: %s", e)
-                    write_atomic_json(chk_path, page_objs)
-                    if pg not in processed_pages:
-                        processed_pages.append(pg)
-                    merged.extend(page_objs)
-                    ordered_objs.extend(page_objs)
-                    LOG.info("Page %d → %d object(s) [checkpoint saved]", pg, len(page_objs))
-
-                save_manifest(manifest_path, processed_pages)
-                success = True
-            except Exception as e:
-                last_err = e
-                # Detect auth/quota style errors to trigger key rotation
-                err_txt = str(e).lower()
-                rotate = any(tok in err_txt for tok in ["permission", "quota", "unauthorized", "apikey", "api key", "403", "429"])
-                if rotate and len(api_keys) > 1:
-                    old_idx = active_key_index
-                    active_key_index = (active_key_index + 1) % len(api_keys)
-                    if active_key_index != old_idx:
+    for i in range(0, len(page_specs), args.pages_per_call):
+        unit = tuple(page_specs[i:i + args.pages_per_call])
+        # Skip when every page already has a valid checkpoint (checked by the preload)
+        if (not args.force) and all(spec.pg in valid_pages for spec in unit):
+            if len(unit) == 2:
+                LOG.info("Skip pages %d & %d (valid checkpoints).", unit[0].pg, unit[1].pg)
+            else:
+                LOG.info("Skip p%d (valid checkpoint).", unit[0].pg)
+            continue
+        units.append(unit)
+
+    # Per-key admission control (shared by all in-flight calls)
+    rpm_default, tpm_default = MODEL_RATE_LIMITS.get(args.model, (0, 0))
+    rpm = rpm_default if args.rpm is None else args.rpm
+    tpm = tpm_default if args.tpm is None else args.tpm
+    buckets = [KeyBucket(rpm, max(1, args.parallel), tpm) for _ in api_keys]
+
+    async def fetch_unit(sem, unit):
+        """Call the model for one unit with retries. Returns (raw, [(spec, objs, cont_notes)])
+        or None after max_attempts. Continuation notes are returned, not merged: that
+        step depends on page order and happens in commit_unit()."""
+        nonlocal active_key_index
+        dual = len(unit) == 2
+        pg1, img1 = unit[0].pg, unit[0].img
+        pg2, img2 = (unit[1].pg, unit[1].img) if dual else (None, None)
+        async with sem:
+            attempt = 0
+            while attempt < args.max_attempts:
+                attempt += 1
+                key_index = active_key_index
+                try:
+                    # with --stream, array items are parsed while the response arrives
+                    parser = StreamingArrayParser() if args.stream else None
+                    on_delta = parser.feed if parser else None
+                    bucket = buckets[key_index]
+                    await bucket.acquire(estimate_request_tokens(prompt, [spec.img for spec in unit]))
+                    try:
+                        if dual:
+                            LOG.info("[STUDIO] Pages %d+%d attempt %d/%d", pg1, pg2, attempt, args.max_attempts)
+                            raw = await asyncio.to_thread(stream_or_generate_json_dual, adapter, prompt, img1, pg1, img2, pg2, stream=args.stream, show_prompt=args.show_prompt, on_delta=on_delta)
+                        else:
+                            LOG.info("[STUDIO] Page %d attempt %d/%d", pg1, attempt, args.max_attempts)
+                            raw = await asyncio.to_thread(stream_or_generate_json, adapter, prompt, img1, pg1, stream=args.stream, show_prompt=args.show_prompt, on_delta=on_delta)
+                        bucket.on_success()
+                    finally:
+                        await bucket.release()
+                    if not raw.strip():
+                        raise ValueError("Empty response from model")
+
+                    objs = parser.finish() if parser else None
+                    if objs is None:
+                        objs = parse_page_json(raw)
+                    intern_common_fields(objs)
+                    by_pg = split_objects_by_page(objs)
+
+                    out = []
+                    for spec in unit:
+                        page_objs = by_pg.get(spec.pg, [])
+                        # (a) capture + remove page-lead sentinel (sidecar)
+                        if args.page_leads:
+                            page_objs = apply_page_lead_if_any(page_objs, spec.pg, spec.img.name, page_leads)
+                        # (b) continuation sentinel: drop now, merge at commit
+                        page_objs, cont_notes = split_continuation(page_objs)
+
+                        # route notes -> structured scope fields, strip hierarchy, validate (one pass)
+                        ok_pg, errs_pg = postprocess_page(page_objs, spec.pg, spec.img.name)
+                        if not ok_pg and page_objs:
+                            raise ValueError(f"Per-page validation failed for p{spec.pg}: " + " | ".join(errs_pg[:6]))
+                        out.append((spec, page_objs, cont_notes))
+                    return raw, out
+                except Exception as e:
+                    # Detect auth/quota style errors to trigger key rotation
+                    err_txt = str(e).lower()
+                    # Uploaded files expire server-side; re-upload on the next attempt
+                    if "file" in err_txt and any(tok in err_txt for tok in ["expired", "not found", "not exist"]):
+                        for spec in unit:
+                            adapter.forget_upload(spec.img)
+                    retry_after = retry_after_seconds(e)
+                    auth = any(tok in err_txt for tok in _AUTH_ERROR_TOKENS)
+                    throttled = not auth and any(tok in err_txt for tok in _THROTTLE_ERROR_TOKENS)
+                    # auth errors rotate at once; throttling only after repeated hits on this key
+                    rotate = auth or (throttled and buckets[key_index].on_throttle(retry_after))
+                    # only rotate once per failing key, even with several calls in flight
+                    if rotate and len(api_keys) > 1 and key_index == active_key_index:
+                        buckets[key_index].cool_down()
+                        # spread over keys that are not cooling; plain round-robin if all are
+                        ready = [j for j in range(len(api_keys)) if j != key_index and buckets[j].available()]
+                        active_key_index = random.choice(ready) if ready else (key_index + 1) % len(api_keys)
                         new_key = api_keys[active_key_index]
                         try:
                             adapter.reconfigure(new_key)
@@ -749,34 +1251,96 @@ def main():
                             LOG.warning("Rotated API key -> #%d/%d (trigger: %s)", active_key_index+1, len(api_keys), err_txt[:80])
                         except Exception as recfg_err:
                             LOG.error("Failed reconfiguring with rotated key: %s", recfg_err)
-                if dual:
-                    LOG.warning("Pages %d+%d error attempt %d: %s", pg1, pg2, attempt, e)
-                else:
-                    LOG.warning("Page %d error attempt %d: %s", pg1, attempt, e)
-                if attempt < args.max_attempts:
-                    sleep_s = args.retry_backoff * (2 ** (attempt - 1))
                     if dual:
-                        LOG.info("Retrying pages %d+%d after %.1fs …", pg1, pg2, sleep_s)
+                        LOG.warning("Pages %d+%d error attempt %d: %s", pg1, pg2, attempt, e)
                     else:
-                        LOG.info("Retrying page %d after %.1fs …", pg1, sleep_s)
-                    time.sleep(sleep_s)
-        if not success:
-            if dual:
-                LOG.error("FAILED pages %d+%d after %d attempts. Leaving for resume.", pg1, pg2, args.max_attempts)
-            else:
-                LOG.error("FAILED page %d after %d attempts. Leaving for resume.", pg1, args.max_attempts)
-        i += 2 if dual else 1
+                        LOG.warning("Page %d error attempt %d: %s", pg1, attempt, e)
+                    if attempt < args.max_attempts:
+                        # full jitter, but never sooner than the server asked for
+                        sleep_s = max(retry_after or 0.0, random.uniform(0, args.retry_backoff * (2 ** (attempt - 1))))
+                        if dual:
+                            LOG.info("Retrying pages %d+%d after %.1fs …", pg1, pg2, sleep_s)
+                        else:
+                            LOG.info("Retrying page %d after %.1fs …", pg1, sleep_s)
+                        await asyncio.sleep(sleep_s)
+        if dual:
+            LOG.error("FAILED pages %d+%d after %d attempts. Leaving for resume.", pg1, pg2, args.max_attempts)
+        else:
+            LOG.error("FAILED page %d after %d attempts. Leaving for resume.", pg1, args.max_attempts)
+        return None
 
-    # Final write (always rebuilt from 'merged' accumulated during this run)
-    write_atomic_json(args.final_path, merged)
-    LOG.info("FINAL total: %d object(s) → %s", len(merged), args.final_path)
+    writer = CheckpointWriter(args.checkpoint_batch)
+    unsaved: List[Tuple[int, int]] = []  # (page, object count) written but not yet in the manifest
+
+    async def flush_checkpoints():
+        await writer.flush()
+        for pg, n in unsaved:
+            if pg not in processed_pages:
+                processed_pages.append(pg)
+            # empty pages are never treated as valid checkpoints on resume
+            if n:
+                validated_pages.add(pg)
+            else:
+                validated_pages.discard(pg)
+            LOG.info("Page %d → %d object(s) [checkpoint saved]", pg, n)
+        unsaved.clear()
+        save_manifest(manifest_path, processed_pages, current_version, sorted(validated_pages))
+
+    async def commit_unit(unit, raw, out):
+        """Apply continuation and submit checkpoint writes, in page order.
+
+        Writes are batched by the CheckpointWriter; the manifest is only saved
+        after a batch is flushed, so it only lists pages that are on disk."""
+        pg1, pg2 = unit[0].pg, unit[-1].pg
+        for spec, page_objs, cont_notes in out:
+            merge_continuation_into_buckets(cont_notes, page_buckets, bucket_pages, spec.pg)
+            chk_path = spec.chk
+            if args.save_raw and spec.pg == pg1:  # save once per call
+                raw_path = chk_path.with_suffix('.raw.txt') if len(unit) == 1 else (chk_path.parent / f"{pdf_stem}_p{pg1:05d}_p{pg2:05d}.raw.txt")
+                writer.submit_raw(raw_path, raw)
+            # serialize now: a later page's continuation may still extend these objects
+            writer.submit(chk_path, json_dumps_bytes(page_objs))
+            unsaved.append((spec.pg, len(page_objs)))
+            set_bucket(spec.pg, page_objs)
+        if writer.due:
+            await flush_checkpoints()
+
+    async def run_units():
+        workers = max(1, args.parallel)
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers))
+        sem = asyncio.Semaphore(workers)
+
+        async def indexed(i, unit):
+            return i, await fetch_unit(sem, unit)
+
+        # Collect units as they finish; commit the finished prefix in page
+        # order, since continuation notes may reach back into the previous page
+        ready: Dict[int, Any] = {}
+        next_i = 0
+        for fut in asyncio.as_completed([indexed(i, u) for i, u in enumerate(units)]):
+            i, res = await fut
+            ready[i] = res
+            while next_i in ready:
+                res = ready.pop(next_i)
+                if res is not None:
+                    await commit_unit(units[next_i], *res)
+                next_i += 1
+        if unsaved:
+            await flush_checkpoints()
+
+    if units:
+        asyncio.run(run_units())
+
+    # Final write (always rebuilt from the page buckets of this run, in page order)
+    total = write_atomic_json_array(args.final_path, (page_buckets[pg] for pg in bucket_pages), durable=True)
+    LOG.info("FINAL total: %d object(s) → %s", total, args.final_path)
     LOG.info("Processed pages this run or previously: %s", processed_pages)
 
     # Sidecar for page-leads (if any captured)
     if args.page_leads and page_leads:
         lead_path = args.jsons_dir / f"{pdf_stem}.page_leads.json"
         try:
-            write_atomic_json(lead_path, [page_leads[k] for k in sorted(page_leads.keys())])
+            write_atomic_json(lead_path, [page_leads[k] for k in sorted(page_leads.keys())], durable=True)
             LOG.info("PAGE LEADS: %d page(s) → %s", len(page_leads), lead_path)
         except Exception as e:
             LOG.warning("Failed writing page-leads sidecar: %s", e)
@@ -11,33 +11,58 @@ Enhancements:
  - Cross-reference edges (dashed) from seeAlso scope notes (codes pattern).
 """
 from __future__ import annotations
-import json, re
+import json, mmap, os, re
+from collections import defaultdict
 from pathlib import Path
 
+try:
+    import orjson  # optional, much faster (de)serialization
+except Exception:
+    orjson = None
+
+
+def load_json_bytes(raw):
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(bytes(raw))
+
+
+def load_json_file(path: Path):
+    """Parse a JSON file straight from a read-only mmap, without a decoded str copy."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap rejects empty files
+            return load_json_bytes(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as mv:
+                return load_json_bytes(mv)
+
+
+def js_literal(obj) -> str:
+    """Serialize obj as a JSON literal for embedding in the page script."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj)
+
 INPUT_FILES = sorted(Path('processed').glob('Sch*.deduped.json'))
 OUTPUT_FILE = Path('hierarchy_graph.html')
 
-entries = []
+# Index each file as it is loaded; only the first entry per code is kept
+code_to_entry = {}
+children_map = defaultdict(set)
 for f in INPUT_FILES:
     try:
-        data = json.loads(f.read_text(encoding='utf-8'))
-        if isinstance(data, list):
-            entries.extend(data)
+        data = load_json_file(f)
     except Exception:
-        pass
-
-code_to_entry = {}
-children_map = {}
-for e in entries:
-    code = e.get('bfCode') or e.get('fullNotation') or e.get('notation') or e.get('id')
-    if code not in code_to_entry:
-        code_to_entry[code] = e
-    hier = e.get('hierarchy') or {}
-    kids = hier.get('narrower') or []
-    if code not in children_map:
-        children_map[code] = set()
-    for k in kids:
-        children_map[code].add(k)
+        continue
+    if not isinstance(data, list):
+        continue
+    for e in data:
+        code = e.get('bfCode') or e.get('fullNotation') or e.get('notation') or e.get('id')
+        code_to_entry.setdefault(code, e)
+        kids = (e.get('hierarchy') or {}).get('narrower')
+        if kids:
+            children_map[code].update(kids)
+    del data
 
 three_digit_pattern = re.compile(r'^\d{3}$')
 initial_nodes = {code for code in code_to_entry if three_digit_pattern.match(code)}
@@ -51,11 +76,13 @@ for code in initial_nodes:
     color = 'lightgreen'
     nodes_js.append({'id': code,'label': code,'title': title,'color': {'background': color,'border':'gray'},'shape':'box'})
 
+# only codes with children; the page treats a missing key as a leaf
 children_map_serializable = {k: sorted(v) for k,v in children_map.items()}
 
-meta = {}
 code_pattern = re.compile(r"\b\d{3}(?:\.\d+)?\b")
-for code, e in code_to_entry.items():
+
+def entry_meta(code, e):
+    """Label, first scope snippet and seeAlso cross-references of one entry."""
     scope = e.get('scope') or {}
     pref = (e.get('prefLabel') or {}).get('en') or ''
     snippet = ''
@@ -64,104 +91,144 @@ for code, e in code_to_entry.items():
         if arr:
             snippet = arr[0][:80]
             break
-    refs = set()
-    for line in scope.get('seeAlso') or []:
-        for m in code_pattern.findall(line):
-            if m != code:
-                refs.add(m)
-        meta[code] = {'pref': pref,'snippet': snippet,'seeRefs': sorted(refs)}
-
-# Build HTML directly without templates
-html_parts = []
-html_parts.append('<!DOCTYPE html>')
-html_parts.append('<html lang="en">')
-html_parts.append('<head>')
-html_parts.append('<meta charset="utf-8" />')
-html_parts.append('<title>Hierarchy Graph</title>')
-html_parts.append('<script src="https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.js"></script>')
-html_parts.append('<link rel="stylesheet" href="https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.css" />')
-html_parts.append('<style>')
-html_parts.append('  body { font-family: Arial, sans-serif; margin:0; padding:0; }')
-html_parts.append('  #toolbar { padding:8px; background:#eee; display:flex; gap:8px; align-items:center; flex-wrap:wrap; }')
-html_parts.append('  #network { width:100vw; height:calc(100vh - 60px); border-top:1px solid #ccc; }')
-html_parts.append('  input[type=text] { padding:4px; }')
-html_parts.append('  button { padding:6px 10px; cursor:pointer; }')
-html_parts.append('</style>')
-html_parts.append('</head>')
-html_parts.append('<body>')
-html_parts.append('<div id="toolbar">')
-html_parts.append('  <button id="togglePhysics">Toggle Physics</button>')
-html_parts.append('  <button id="toggleHeadings">Show Headings</button>')
-html_parts.append('  <button id="expandSelection">Expand Selection</button>')
-html_parts.append('  <button id="expandAllChildren">Expand All Children (Visible Roots)</button>')
-html_parts.append('  <input id="searchBox" type="text" placeholder="Search code..." />')
-html_parts.append('  <button id="searchBtn">Search</button>')
-html_parts.append('  <span id="status"></span>')
-html_parts.append('</div>')
-html_parts.append('<div id="network"></div>')
-html_parts.append('<script>')
-html_parts.append('console.log("Starting hierarchy graph...");')
-html_parts.append('const initialNodes = ' + json.dumps(nodes_js) + ';')
-html_parts.append('const initialEdges = ' + json.dumps(edges_js) + ';')
-html_parts.append('const allChildren = ' + json.dumps(children_map_serializable) + ';')
-html_parts.append('const meta = ' + json.dumps(meta) + ';')
-html_parts.append('console.log("Loaded", initialNodes.length, "initial nodes");')
-html_parts.append('let showHeadings = false;')
-html_parts.append('const nodeCache = {};')
-html_parts.append('const added = new Set(initialNodes.map(n=>n.id));')
-html_parts.append('function computeNode(code) {')
-html_parts.append('  let color="lightblue";')
-html_parts.append('  if(code.indexOf("-")!==-1) color="orange";')
-html_parts.append('  else if(code.indexOf(".")===-1) color="lightgreen";')
-html_parts.append('  const m = meta[code]||{};')
-html_parts.append('  let label = code;')
-html_parts.append('  if (showHeadings) { if(m.pref) label += "\\n"+m.pref.substring(0,50); if(m.snippet) label += "\\n"+m.snippet.substring(0,60); }')
-html_parts.append('  let title = `<b>${code}</b>`;')
-html_parts.append('  if(m.pref) title += `<br>${m.pref}`;')
-html_parts.append('  if(m.snippet) title += `<br><i>${m.snippet}</i>`;')
-html_parts.append('  return { id: code, label: label, title: title, color: {background: color, border: "gray"}, shape:"box" };')
-html_parts.append('}')
-html_parts.append('for (const n of initialNodes) { nodeCache[n.id]=n; }')
-html_parts.append('const nodes = new vis.DataSet(initialNodes);')
-html_parts.append('const edges = new vis.DataSet(initialEdges);')
-html_parts.append('let physicsEnabled=true;')
-html_parts.append('const network = new vis.Network(document.getElementById("network"), {nodes,edges}, { physics: {enabled:physicsEnabled, stabilization:false, solver:"forceAtlas2Based", timestep:0.35}, interaction: {hover:true}, layout: {improvedLayout:true} });')
-html_parts.append('network.fit();')
-html_parts.append('console.log("Network initialized and fitted");')
-html_parts.append('function expandNode(code) {')
-html_parts.append('  const kids = allChildren[code]||[]; let addedCount=0;')
-html_parts.append('  for (const k of kids) {')
-html_parts.append('    if(!added.has(k)) { nodes.add(computeNode(k)); edges.add({from:code,to:k}); added.add(k); addedCount++; }')
-html_parts.append('    else if(!edges.get({filter:e=>e.from===code && e.to===k}).length) edges.add({from:code,to:k});')
-html_parts.append('  }')
-html_parts.append('  const m = meta[code];')
-html_parts.append('  if(m&&m.seeRefs) { for(const ref of m.seeRefs) { if(ref===code) continue; if(!added.has(ref) && /^\\d{3}$/.test(ref)) { nodes.add(computeNode(ref)); added.add(ref); } if(added.has(ref) && !edges.get({filter:e=>(e.from===code&&e.to===ref)||(e.from===ref&&e.to===code)}).length) edges.add({from:code,to:ref,dashes:true,color:{color:"#aa5500"},width:2}); } }')
-html_parts.append('  return addedCount;')
-html_parts.append('}')
-html_parts.append('document.getElementById("togglePhysics").onclick=()=>{ physicsEnabled=!physicsEnabled; network.setOptions({physics:{enabled:physicsEnabled}}); };')
-html_parts.append('document.getElementById("expandSelection").onclick=()=>{ const sel=network.getSelectedNodes(); let total=0; sel.forEach(c=>total+=expandNode(c)); document.getElementById("status").textContent=`Added ${total} nodes.`; };')
-html_parts.append('document.getElementById("expandAllChildren").onclick=()=>{ let total=0; nodes.get().forEach(n=>total+=expandNode(n.id)); document.getElementById("status").textContent=`Added ${total} nodes.`; };')
-html_parts.append('document.getElementById("toggleHeadings").onclick=()=>{ showHeadings=!showHeadings; document.getElementById("toggleHeadings").textContent= showHeadings? "Hide Headings":"Show Headings"; nodes.get().forEach(n=>{ const nn=computeNode(n.id); nodes.update({id:n.id,label:nn.label,title:nn.title}); }); };')
-html_parts.append('network.on("doubleClick",p=>{ if(p.nodes&&p.nodes.length){ const c=p.nodes[0]; const g=expandNode(c); document.getElementById("status").textContent=`Expanded ${c} (+${g})`; } });')
-html_parts.append('function search(term){ term=term.toLowerCase(); const candidates=Object.keys(allChildren).filter(c=>c.toLowerCase().includes(term)); if(!candidates.length) return document.getElementById("status").textContent="No match"; const first=candidates[0]; if(!added.has(first)) expandNode(first); network.selectNodes([first]); network.focus(first, {scale:1.1, animation: {duration:500,easing:"easeInOutQuad"}}); document.getElementById("status").textContent=`Focused ${first} (${candidates.length} match(es))`; }')
-html_parts.append('document.getElementById("searchBtn").onclick=()=>{ const v=document.getElementById("searchBox").value.trim(); if(v) search(v); };')
-html_parts.append('document.getElementById("searchBox").addEventListener("keydown",e=>{ if(e.key==="Enter"){ const v=e.target.value.trim(); if(v) search(v); } });')
-html_parts.append('</script>')
-html_parts.append('</body>')
-html_parts.append('</html>')
-
-html = '\n'.join(html_parts)
+    # one findall over all seeAlso lines instead of one per line
+    refs = set(code_pattern.findall('\n'.join(scope.get('seeAlso') or [])))
+    refs.discard(code)
+    return {'pref': pref,'snippet': snippet,'seeRefs': sorted(refs)}
+
+# every entry gets meta, including those without seeAlso notes
+meta = {code: entry_meta(code, e) for code, e in code_to_entry.items()}
+
+
+def node_color(code):
+    if '-' in code:
+        return 'orange'
+    if '.' not in code:
+        return 'lightgreen'
+    return 'lightblue'
+
+
+def node_info(code):
+    """[color, label with headings, title] of a node, so the page does no string work per expansion."""
+    m = meta.get(code) or {}
+    pref, snippet = m.get('pref') or '', m.get('snippet') or ''
+    label = code
+    if pref:
+        label += '\n' + pref[:50]
+    if snippet:
+        label += '\n' + snippet[:60]
+    title = f"<b>{code}</b>"
+    if pref:
+        title += f"<br>{pref}"
+    if snippet:
+        title += f"<br><i>{snippet}</i>"
+    return [node_color(code), label, title]
+
+# Every code the page can show: entries, their children and seeAlso targets
+# (entries first, in input order: search lists the keys of this map)
+node_info_map = {code: node_info(code) for code in code_to_entry if isinstance(code, str)}
+other_codes = {k for kids in children_map.values() for k in kids}
+other_codes.update(r for m in meta.values() for r in m['seeRefs'])
+for code in sorted(c for c in other_codes if isinstance(c, str) and c not in node_info_map):
+    node_info_map[code] = node_info(code)
+see_refs = {code: m['seeRefs'] for code, m in meta.items() if m['seeRefs']}
+
+# The page gets one code table; children, seeAlso refs and node info refer to
+# codes by index into it, which keeps repeated codes out of the payload
+codes = list(node_info_map)
+code_idx = {c: i for i, c in enumerate(codes)}
+graph_data = {
+    'codes': codes,
+    'nodeInfo': list(node_info_map.values()),
+    'allChildren': {code_idx[k]: [code_idx[c] for c in kids if c in code_idx]
+                    for k, kids in children_map_serializable.items() if k in code_idx},
+    'seeRefs': {code_idx[k]: [code_idx[r] for r in refs] for k, refs in see_refs.items() if k in code_idx},
+    'initialNodes': nodes_js,
+    'initialEdges': edges_js,
+}
 
 # Use unique tokens to avoid str.format brace collisions
 html_template = """<!DOCTYPE html>
-<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\" />\n<title>Hierarchy Graph</title>\n<script src=\"https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.js\"></script>\n<link rel=\"stylesheet\" href=\"https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.css\" />\n<style>\n  body {{ font-family: Arial, sans-serif; margin:0; padding:0; }}\n  #toolbar {{ padding:8px; background:#eee; display:flex; gap:8px; align-items:center; flex-wrap:wrap; }}\n  #network {{ width:100vw; height:calc(100vh - 60px); border-top:1px solid #ccc; }}\n  input[type=text] {{ padding:4px; }}\n  button {{ padding:6px 10px; cursor:pointer; }}\n</style>\n</head>\n<body>\n<div id=\"toolbar\">\n  <button id=\"togglePhysics\">Toggle Physics</button>\n  <button id=\"toggleHeadings\">Show Headings</button>\n  <button id=\"expandSelection\">Expand Selection</button>\n  <button id=\"expandAllChildren\">Expand All Children (Visible Roots)</button>\n  <input id=\"searchBox\" type=\"text\" placeholder=\"Search code...\" />\n  <button id=\"searchBtn\">Search</button>\n  <span id=\"status\"></span>\n</div>\n<div id=\"network\"></div>\n<script>\nconst initialNodes = __NODES__;\nconst initialEdges = __EDGES__;\nconst allChildren = __CHILDREN__;\nconst meta = __META__;\nlet showHeadings = false;\nconst nodeCache = {{}};\nconst added = new Set(initialNodes.map(n=>n.id));\nfunction computeNode(code) {{\n  let color='lightblue';\n  if(code.indexOf('-')!==-1) color='orange';\n  else if(code.indexOf('.')===-1) color='lightgreen';\n  const m = meta[code]||{{}};\n  let label = code;\n  if (showHeadings) {{ if(m.pref) label += "\\n"+m.pref.substring(0,50); if(m.snippet) label += "\\n"+m.snippet.substring(0,60); }}\n  let title = `<b>\\${{code}}</b>`;\n  if(m.pref) title += `<br>\\${{m.pref}}`;\n  if(m.snippet) title += `<br><i>\\${{m.snippet}}</i>`;\n  return {{ id: code, label: label, title: title, color: {{background: color, border: 'gray'}}, shape:'box' }};\n}}\nfor (const n of initialNodes) {{ nodeCache[n.id]=n; }}\nconst nodes = new vis.DataSet(initialNodes);\nconst edges = new vis.DataSet(initialEdges);\nlet physicsEnabled=true;\nconst network = new vis.Network(document.getElementById('network'), {{nodes,edges}}, {{ physics: {{enabled:physicsEnabled, stabilization:false, solver:'forceAtlas2Based', timestep:0.35}}, interaction: {{hover:true}}, layout: {{improvedLayout:true}} }});\nfunction expandNode(code) {{\n  const kids = allChildren[code]||[]; let addedCount=0;\n  for (const k of kids) {{\n    if(!added.has(k)) {{ nodes.add(computeNode(k)); edges.add({{from:code,to:k}}); added.add(k); addedCount++; }}\n    else if(!edges.get({{filter:e=>e.from===code && e.to===k}}).length) edges.add({{from:code,to:k}});\n  }}\n  const m = meta[code];\n  if(m&&m.seeRefs) {{ for(const ref of m.seeRefs) {{ if(ref===code) continue; if(!added.has(ref) && /^\d{3}$/.test(ref)) {{ nodes.add(computeNode(ref)); added.add(ref); }} if(added.has(ref) && !edges.get({{filter:e=>(e.from===code&&e.to===ref)||(e.from===ref&&e.to===code)}}).length) edges.add({{from:code,to:ref,dashes:true,color:{{color:'#aa5500'}},width:2}}); }} }}\n  return addedCount;\n}}\ndocument.getElementById('togglePhysics').onclick=()=>{{ physicsEnabled=!physicsEnabled; network.setOptions({{physics:{{enabled:physicsEnabled}}}}); }};\ndocument.getElementById('expandSelection').onclick=()=>{{ const sel=network.getSelectedNodes(); let total=0; sel.forEach(c=>total+=expandNode(c)); document.getElementById('status').textContent=`Added \\${{total}} nodes.`; }};\ndocument.getElementById('expandAllChildren').onclick=()=>{{ let total=0; nodes.get().forEach(n=>total+=expandNode(n.id)); document.getElementById('status').textContent=`Added \\${{total}} nodes.`; }};\ndocument.getElementById('toggleHeadings').onclick=()=>{{ showHeadings=!showHeadings; document.getElementById('toggleHeadings').textContent= showHeadings? 'Hide Headings':'Show Headings'; nodes.get().forEach(n=>{{ const nn=computeNode(n.id); nodes.update({{id:n.id,label:nn.label,title:nn.title}}); }}); }};\nnetwork.on('doubleClick',p=>{{ if(p.nodes&&p.nodes.length){{ const c=p.nodes[0]; const g=expandNode(c); document.getElementById('status').textContent=`Expanded \\${{c}} (+\\${{g}})`; }} }});\nfunction search(term){{ term=term.toLowerCase(); const candidates=Object.keys(allChildren).filter(c=>c.toLowerCase().includes(term)); if(!candidates.length) return document.getElementById('status').textContent='No match'; const first=candidates[0]; if(!added.has(first)) expandNode(first); network.selectNodes([first]); network.focus(first, {{scale:1.1, animation: {{duration:500,easing:'easeInOutQuad'}}}}); document.getElementById('status').textContent=`Focused \\${{first}} (\\${{candidates.length}} match(es))`; }}\ndocument.getElementById('searchBtn').onclick=()=>{{ const v=document.getElementById('searchBox').value.trim(); if(v) search(v); }};\ndocument.getElementById('searchBox').addEventListener('keydown',e=>{{ if(e.key==='Enter'){{ const v=e.target.value.trim(); if(v) search(v); }} }});\n</script>\n</body>\n</html>\n"""
-
-# Perform safe replacements
-html = (html_template
-        .replace('__NODES__', json.dumps(nodes_js))
-        .replace('__EDGES__', json.dumps(edges_js))
-        .replace('__CHILDREN__', json.dumps(children_map_serializable))
-        .replace('__META__', json.dumps(meta)))
+<html lang="en">
+<head>
+<meta charset="utf-8" />
+<title>Hierarchy Graph</title>
+<script src="https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.js"></script>
+<link rel="stylesheet" href="https://unpkg.com/vis-network@9.1.6/dist/vis-network.min.css" />
+<style>
+  body { font-family: Arial, sans-serif; margin:0; padding:0; }
+  #toolbar { padding:8px; background:#eee; display:flex; gap:8px; align-items:center; flex-wrap:wrap; }
+  #network { width:100vw; height:calc(100vh - 60px); border-top:1px solid #ccc; }
+  input[type=text] { padding:4px; }
+  button { padding:6px 10px; cursor:pointer; }
+</style>
+</head>
+<body>
+<div id="toolbar">
+  <button id="togglePhysics">Toggle Physics</button>
+  <button id="toggleHeadings">Show Headings</button>
+  <button id="expandSelection">Expand Selection</button>
+  <button id="expandAllChildren">Expand All Children (Visible Roots)</button>
+  <input id="searchBox" type="text" placeholder="Search code..." />
+  <button id="searchBtn">Search</button>
+  <span id="status"></span>
+</div>
+<div id="network"></div>
+<script type="application/json" id="graph-data">__DATA__</script>
+<script>
+// Parsed as JSON rather than evaluated as a JS literal
+const {codes, nodeInfo, allChildren, seeRefs, initialNodes, initialEdges} = JSON.parse(document.getElementById('graph-data').textContent);
+// allChildren/seeRefs map a code index to code indexes; nodeInfo[i] = [color, label with headings, title]
+const codeIdx = new Map(codes.map((c,i)=>[c,i]));
+let showHeadings = false;
+const nodeCache = {};
+const added = new Set(initialNodes.map(n=>n.id));
+const edgeKeys = new Set(initialEdges.map(e=>`${e.from}->${e.to}`));  // "from->to" of every edge shown
+function computeNode(code) {
+  const [color, headingsLabel, title] = nodeInfo[codeIdx.get(code)];
+  return { id: code, label: showHeadings ? headingsLabel : code, title: title, color: {background: color, border: 'gray'}, shape:'box' };
+}
+for (const n of initialNodes) { nodeCache[n.id]=n; }
+const nodes = new vis.DataSet(initialNodes);
+const edges = new vis.DataSet(initialEdges);
+let physicsEnabled=true;
+const network = new vis.Network(document.getElementById('network'), {nodes,edges}, { physics: {enabled:physicsEnabled, stabilization:false, solver:'forceAtlas2Based', timestep:0.35}, interaction: {hover:true}, layout: {improvedLayout:true} });
+function expandNode(code) {
+  const i = codeIdx.get(code);
+  const kids = allChildren[i]||[]; let addedCount=0;
+  for (const k of kids.map(j=>codes[j])) {
+    if(!added.has(k)) { nodes.add(computeNode(k)); added.add(k); addedCount++; }
+    if(!edgeKeys.has(`${code}->${k}`)) { edges.add({from:code,to:k}); edgeKeys.add(`${code}->${k}`); }
+  }
+  const refs = seeRefs[i];
+  if(refs) { for(const ref of refs.map(j=>codes[j])) { if(ref===code) continue; if(!added.has(ref) && /^\\d{3}$/.test(ref)) { nodes.add(computeNode(ref)); added.add(ref); } if(added.has(ref) && !edgeKeys.has(`${code}->${ref}`) && !edgeKeys.has(`${ref}->${code}`)) { edges.add({from:code,to:ref,dashes:true,color:{color:'#aa5500'},width:2}); edgeKeys.add(`${code}->${ref}`); } } }
+  return addedCount;
+}
+document.getElementById('togglePhysics').onclick=()=>{ physicsEnabled=!physicsEnabled; network.setOptions({physics:{enabled:physicsEnabled}}); };
+document.getElementById('expandSelection').onclick=()=>{ const sel=network.getSelectedNodes(); let total=0; sel.forEach(c=>total+=expandNode(c)); document.getElementById('status').textContent=`Added ${total} nodes.`; };
+document.getElementById('expandAllChildren').onclick=()=>{ let total=0; nodes.get().forEach(n=>total+=expandNode(n.id)); document.getElementById('status').textContent=`Added ${total} nodes.`; };
+document.getElementById('toggleHeadings').onclick=()=>{ showHeadings=!showHeadings; document.getElementById('toggleHeadings').textContent= showHeadings? 'Hide Headings':'Show Headings'; nodes.get().forEach(n=>{ const nn=computeNode(n.id); nodes.update({id:n.id,label:nn.label,title:nn.title}); }); };
+network.on('doubleClick',p=>{ if(p.nodes&&p.nodes.length){ const c=p.nodes[0]; const g=expandNode(c); document.getElementById('status').textContent=`Expanded ${c} (+${g})`; } });
+function search(term){ term=term.toLowerCase(); const candidates=codes.filter(c=>c.toLowerCase().includes(term)); if(!candidates.length) return document.getElementById('status').textContent='No match'; const first=candidates[0]; if(!added.has(first)) expandNode(first); network.selectNodes([first]); network.focus(first, {scale:1.1, animation: {duration:500,easing:'easeInOutQuad'}}); document.getElementById('status').textContent=`Focused ${first} (${candidates.length} match(es))`; }
+document.getElementById('searchBtn').onclick=()=>{ const v=document.getElementById('searchBox').value.trim(); if(v) search(v); };
+document.getElementById('searchBox').addEventListener('keydown',e=>{ if(e.key==='Enter'){ const v=e.target.value.trim(); if(v) search(v); } });
+</script>
+</body>
+</html>
+"""
 
-OUTPUT_FILE.write_text(html, encoding='utf-8')
+# Fill the tokens in one pass, writing the pieces straight to the output;
+# the template and data are never copied into a whole-page string
+template_data = {
+    '__DATA__': graph_data,
+}
+token_re = re.compile('|'.join(map(re.escape, template_data)))
+with OUTPUT_FILE.open('w', encoding='utf-8') as out:
+    pos = 0
+    for m in token_re.finditer(html_template):
+        out.write(html_template[pos:m.start()])
+        # keep "</script>" and "<!--" in the data from ending or confusing the script block
+        out.write(js_literal(template_data[m.group(0)]).replace('</', '<\\/').replace('<!--', '\\u003c!--'))
+        pos = m.end()
+    out.write(html_template[pos:])
 print(f"Wrote {OUTPUT_FILE} with {len(initial_nodes)} initial nodes (enhanced).")
@@ -26,18 +26,45 @@ Usage:
 Notes:
 - Page numbers are 1-based in the CLI; inclusive ranges.
 - Encrypted PDFs: provide --password if needed.
+- --workers writes --ranges/--cuts parts in parallel. Workers are forked after the PDF is parsed,
+  so they share the reader copy-on-write instead of re-parsing it.
+  Without fork (Windows/macOS default), everything runs in one process.
+- On Linux, outputs are written with O_DIRECT so multi-GB parts do not push the
+  input PDF out of the page cache. Other platforms and filesystems that reject
+  O_DIRECT use ordinary buffered writes.
+- --shard-size N puts part i under <outdir>/<i // N, 4 digits>/ so very long
+  --cuts/--ranges runs never pile more than N files into one directory.
 """
 
 from __future__ import annotations
 
 import argparse
+import errno
+import gc
+import mmap
+import multiprocessing as mp
+import os
 from pathlib import Path
 from typing import List, Tuple
 import sys
 
-from pypdf import PdfReader, PdfWriter
+from pypdf import PageObject, PdfReader, PdfWriter
 from tqdm import tqdm
 
+try:
+    import fcntl  # POSIX only; used to drop O_DIRECT if a filesystem rejects it
+except Exception:
+    fcntl = None
+
+# pypdf serializes through many small write() calls; batch them into 1 MiB
+WRITE_BUFFER = 1 << 20
+O_DIRECT = getattr(os, "O_DIRECT", 0) if fcntl else 0
+DIRECT_ALIGN = 4096  # O_DIRECT length/offset alignment (logical block size upper bound)
+
+# Set before forking; pool workers inherit the parsed reader and its
+# materialized page list copy-on-write
+_READER: PdfReader | None = None
+_PAGES: List[PageObject] = []
 
 def parse_ranges_spec(spec: str, total: int) -> List[Tuple[int, int]]:
     """
@@ -97,18 +124,155 @@ def parse_cuts_spec(spec: str, total: int) -> List[Tuple[int, int]]:
     return segments
 
 
-def write_chunk(reader: PdfReader, start: int, end: int, outpath: Path) -> int:
+class DirectWriter:
+    """
+    Write-only binary file over an O_DIRECT fd.
+
+    Data is staged in a page-aligned anonymous mmap and written out in
+    WRITE_BUFFER-sized aligned blocks. The final block is zero-padded to
+    DIRECT_ALIGN and the file is then truncated back to its real length. Only
+    write()/tell()/flush()/close() are provided, which is all PdfWriter.write() uses.
+    """
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.buf = mmap.mmap(-1, WRITE_BUFFER)  # anonymous maps are page-aligned
+        self.fill = 0
+        self.pos = 0
+        self.direct = True
+
+    def write(self, data) -> int:
+        mv = memoryview(data)
+        n = len(mv)
+        off = 0
+        while off < n:
+            k = min(n - off, WRITE_BUFFER - self.fill)
+            self.buf[self.fill:self.fill + k] = mv[off:off + k]
+            self.fill += k
+            off += k
+            if self.fill == WRITE_BUFFER:
+                self._drain(WRITE_BUFFER)
+        self.pos += n
+        return n
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self) -> None:
+        pass  # only whole aligned blocks can be written before close()
+
+    def _drain(self, length: int) -> None:
+        with memoryview(self.buf) as view:
+            done = 0
+            while done < length:
+                try:
+                    done += os.write(self.fd, view[done:length])
+                except OSError as e:
+                    if e.errno != errno.EINVAL or not self.direct:
+                        raise
+                    # Accepted at open() but not on write: continue buffered
+                    flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+                    fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~O_DIRECT)
+                    self.direct = False
+        self.fill = 0
+
+    def close(self) -> None:
+        if self.fd < 0:
+            return
+        try:
+            if self.fill:
+                padded = -(-self.fill // DIRECT_ALIGN) * DIRECT_ALIGN
+                self.buf[self.fill:padded] = bytes(padded - self.fill)
+                self._drain(padded)
+                os.ftruncate(self.fd, self.pos)
+        finally:
+            self.buf.close()
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_output(outpath: Path):
+    """Open outpath for writing with O_DIRECT where supported, else 1 MiB-buffered."""
+    if O_DIRECT:
+        try:
+            fd = os.open(outpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_DIRECT, 0o644)
+        except OSError:
+            pass
+        else:
+            return DirectWriter(fd)
+    return outpath.open("wb", buffering=WRITE_BUFFER)
+
+
+def write_pdf(writer: PdfWriter, outpath: Path) -> None:
+    """
+    Serialize writer to outpath, then drop the writer's page objects so the
+    next part starts from a clean heap.
+    """
+    with open_output(outpath) as f:
+        writer.write(f)
+    if hasattr(writer, "close"):
+        writer.close()
+    # pypdf object graphs are full of reference cycles
+    gc.collect()
+
+
+def dedupe_objects(writer: PdfWriter) -> None:
+    """Collapse byte-identical objects (pypdf >= 5); a no-op on older pypdf."""
+    if hasattr(writer, "compress_identical_objects"):
+        writer.compress_identical_objects()
+
+
+def write_pages(reader: PdfReader, pages: List[PageObject], outpath: Path, dedupe: bool = False) -> int:
     """
-    Write pages [start..end] (1-based inclusive) from reader to outpath.
+    Write the given pages of reader, in order, to outpath.
+    One append() call clones resources shared between the pages (fonts,
+    images) once instead of once per page. append() keys pages by object
+    number, so a selection that repeats a page would lose the /Annots of all
+    but its last copy; such selections go through add_page() one by one.
+    dedupe additionally collapses identical objects before writing.
     Returns number of pages written.
     """
     writer = PdfWriter()
-    for p in range(start, end + 1):
-        writer.add_page(reader.pages[p - 1])
+    if len({page.indirect_reference.idnum for page in pages}) < len(pages):
+        for page in pages:
+            writer.add_page(page)
+    else:
+        writer.append(reader, pages=list(pages), import_outline=False)
+    if dedupe:
+        dedupe_objects(writer)
     outpath.parent.mkdir(parents=True, exist_ok=True)
-    with outpath.open("wb") as f:
-        writer.write(f)
-    return end - start + 1
+    write_pdf(writer, outpath)
+    del writer
+    return len(pages)
+
+
+def write_task(reader: PdfReader, pages: List[PageObject], task: Tuple[range | List[int], Path]) -> Tuple[Path, int]:
+    """Write one (1-based page numbers, outpath) task; returns (outpath, pages written)."""
+    numbers, outpath = task
+    return outpath, write_pages(reader, [pages[p - 1] for p in numbers], outpath)
+
+
+def _write_pages_worker(task: Tuple[range | List[int], Path]) -> Tuple[Path, int]:
+    """Pool worker: write_task() against the reader inherited from the parent."""
+    return write_task(_READER, _PAGES, task)
+
+
+def fork_pool(reader: PdfReader, pages: List[PageObject], workers: int):
+    """
+    Return a fork-context Pool whose workers share reader and pages, or None
+    if fork is unavailable or there is nothing to parallelize.
+    """
+    global _READER, _PAGES
+    if workers <= 1 or "fork" not in mp.get_all_start_methods():
+        return None
+    _READER, _PAGES = reader, pages
+    return mp.get_context("fork").Pool(processes=workers)
 
 
 def main():
@@ -124,6 +288,10 @@ def main():
     group.add_argument("--extract", type=str, help='Extract pages as one combined subset: e.g., "2-3,10,15-18"')
 
     parser.add_argument("--digits", type=int, default=None, help="Zero-pad width for part numbers (default: auto)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Parallel writer processes for --ranges/--cuts (default: CPU count; 1 = no pool)")
+    parser.add_argument("--shard-size", type=int, default=0,
+                        help="Max parts per output subfolder (<part // N> as 4 digits; default 0 = flat)")
     args = parser.parse_args()
 
     pdf_path: Path = args.pdf
@@ -156,7 +324,9 @@ def main():
             print(f"Error decrypting PDF: {e}", file=sys.stderr)
             sys.exit(3)
 
-    total = len(reader.pages)
+    # Flatten the page tree once; every part indexes into this list
+    pages = list(reader.pages)
+    total = len(pages)
 
     # Determine chunks
     chunks: List[Tuple[int, int]]
@@ -178,25 +348,42 @@ def main():
     total_written = 0
     if mode == "extract":
         # single combined file
-        writer = PdfWriter()
         selection = []
         for (s, e) in chunks:
             selection.extend(range(s, e + 1))
-        for p in tqdm(selection, desc="Writing extract", unit="page"):
-            writer.add_page(reader.pages[p - 1])
         outpath = outdir / f"{args.prefix}extract.pdf"
-        with outpath.open("wb") as f:
-            writer.write(f)
+        write_pages(reader, [pages[p - 1] for p in selection], outpath, dedupe=True)
         total_written = len(selection)
         print(f"Wrote {outpath} ({total_written} pages)")
     else:
         # multiple parts
-        for i, (s, e) in enumerate(tqdm(chunks, desc="Writing parts", unit="part"), start=1):
-            part_no = str(i).zfill(digits)
-            outpath = outdir / f"{args.prefix}{part_no}_{str(s).zfill(len(str(total)))}-{str(e).zfill(len(str(total)))}.pdf"
-            written = write_chunk(reader, s, e, outpath)
-            total_written += written
-            print(f"Wrote {outpath} ({written} pages)")
+        tasks = []
+        made = set()
+        total_w = len(str(total))
+        for i, (s, e) in enumerate(chunks, start=1):
+            partdir = outdir
+            if args.shard_size > 0:
+                partdir = outdir / f"{i // args.shard_size:04d}"
+                if partdir not in made:
+                    partdir.mkdir(exist_ok=True)
+                    made.add(partdir)
+            outpath = partdir / f"{args.prefix}{i:0{digits}d}_{s:0{total_w}d}-{e:0{total_w}d}.pdf"
+            tasks.append((range(s, e + 1), outpath))
+        pool = fork_pool(reader, pages, min(args.workers, len(tasks)))
+        if pool is None:
+            results = (write_task(reader, pages, t) for t in tasks)
+        else:
+            # imap keeps part order, so "Wrote ..." lines match a serial run
+            results = pool.imap(_write_pages_worker, tasks)
+        try:
+            for outpath, written in tqdm(results, total=len(tasks), desc="Writing parts", unit="part",
+                                         miniters=max(1, len(tasks) // 200), mininterval=0.25):
+                total_written += written
+                print(f"Wrote {outpath} ({written} pages)")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
     print(f"Done. Total pages written: {total_written} (source had {total} pages)")
 
@@ -6,6 +6,8 @@ Convert every page of a PDF into image files and save them into a new (or specif
 
 Dependencies (install via pip):
     pip install pymupdf tqdm
+    pip install liburing   # optional (Linux): batched io_uring page writes
+    pip install pillow     # optional: faster PNG (zlib level 1), libjpeg-turbo JPEG, TIFF output
 
 Why PyMuPDF?
 - No external system dependency (unlike pdf2image which needs Poppler).
@@ -15,18 +17,460 @@ Usage:
     python pdf_to_images.py input.pdf
     python pdf_to_images.py input.pdf --outdir ./images_out --prefix page_ --dpi 200 --fmt png
     python pdf_to_images.py input.pdf --password "secret" --start 1 --end 10
+    python pdf_to_images.py input.pdf --workers 4
+    python pdf_to_images.py input.pdf --render-dpi 300 --output-dpi 300,150,75
+    python pdf_to_images.py scanned.pdf --fmt jpg --passthrough
+    python pdf_to_images.py huge.pdf --shard-size 1000
 
 Notes:
 - --dpi controls rendering resolution (~72 dpi is PDF default). 200–300 is crisp for OCR.
 - Output filenames follow: {prefix}{page_num}.{fmt}, 1-based page numbers.
+- --shard-size N spreads outputs over <outdir>/<page_num // N, 4 digits>/
+  subfolders so no directory holds more than N files (default 0: flat, which
+  is what gemini.py's --images_dir expects).
+- --output-dpi takes one or more DPIs (comma-separated) and renders each page
+  once, at --render-dpi (default: the largest output DPI). Lower DPIs are
+  downscaled from that master pixmap (a C-level 2^n box shrink when the ratio
+  allows, otherwise a Pixmap rescale) instead of re-rendering the vector
+  content. With several output DPIs each goes to its own <outdir>/<dpi>dpi/.
+- --passthrough: a page that is nothing but one upright, full-page embedded
+  image (a scan) and whose image is already in the requested format is written
+  as the embedded image itself, at its native resolution, with no rasterize or
+  re-encode. Other pages render as usual. Plain JPEG streams of unencrypted
+  PDFs are copied file-to-file in the kernel (copy_file_range/sendfile).
+- Rendering and writing overlap: encoded pages go through a small bounded
+  queue to a writer thread, so page N+1 renders while page N is written.
+- --workers renders blocks of consecutive pages in separate processes (PyMuPDF
+  holds the GIL while rendering, so threads would not help). Each worker opens
+  the PDF itself and encodes/saves its own pages.
+- On Linux with the optional `liburing` package installed, pages are encoded in
+  memory and their file writes are submitted to io_uring in batches instead of
+  one blocking write at a time. Without it, each page's encoded bytes are
+  written with a single write_bytes() call.
+- With Pillow installed, PNGs are written at zlib level 1 (roughly 3x faster to
+  encode, ~15% larger; fine for intermediate OCR images) and TIFFs uncompressed.
+  PyMuPDF itself cannot write TIFF, so --fmt tiff needs Pillow. JPEGs go through
+  Pillow's libjpeg-turbo (quality 95, single scan, no second Huffman pass).
+- Consecutive pages of the same size are rendered into one reused pixmap
+  instead of a freshly allocated one per page.
+- Every STORE_SHRINK_EVERY pages half of MuPDF's global resource store (decoded
+  fonts, images) is dropped, so long image-heavy PDFs keep a bounded RSS.
 """
 
 import argparse
+import io
+import math
+import os
+import queue
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 import fitz  # PyMuPDF
 from tqdm import tqdm
 
+try:
+    import liburing  # optional, Linux only: batched io_uring file writes
+except Exception:
+    liburing = None
+
+try:
+    from PIL import Image  # optional: faster PNG deflate, TIFF support
+except Exception:
+    Image = None
+
+# PyMuPDF >= 1.24 exposes the MuPDF C API as fitz.mupdf; needed for pixmap reuse
+_mupdf = getattr(fitz, "mupdf", None)
+
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 6)
+URING_BATCH = 16  # pages held in memory per io_uring submission
+WRITE_QUEUE_PAGES = 2  # encoded pages waiting for the writer thread
+STORE_SHRINK_EVERY = 50  # pages between trims of MuPDF's font/image cache
+STORE_SHRINK_PERCENT = 50
+
+# Formats handed to Pillow when it is installed: Pillow save() options per extension
+PIL_SAVE = {
+    "png": {"format": "PNG", "compress_level": 1},
+    "tiff": {"format": "TIFF", "compression": None},
+    "tif": {"format": "TIFF", "compression": None},
+    "jpg": {"format": "JPEG", "quality": 95, "subsampling": 0, "optimize": False, "progressive": False},
+}
+PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}  # pix.n -> Pillow mode
+
+
+class IoUringBatchEngine:
+    """
+    Queue whole-file writes and submit them to io_uring `depth` at a time.
+
+    Each queued buffer (and its fd) stays referenced until its completion has
+    been reaped, then both are released.
+    """
+
+    def __init__(self, depth: int = URING_BATCH):
+        self.depth = depth
+        self.ring = liburing.Ring()
+        self.cqe = liburing.Cqe()
+        liburing.io_uring_queue_init(depth, self.ring)
+        self.pending = {}  # user_data -> (fd, data, path)
+        self.seq = 0
+
+    def write(self, path: str, data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        sqe = liburing.io_uring_get_sqe(self.ring)
+        liburing.io_uring_prep_write(sqe, fd, data, 0)
+        liburing.io_uring_sqe_set_data64(sqe, self.seq)
+        self.pending[self.seq] = (fd, data, path)
+        self.seq += 1
+        if len(self.pending) >= self.depth:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        liburing.io_uring_submit(self.ring)
+        error = None
+        while self.pending:
+            liburing.io_uring_wait_cqe(self.ring, self.cqe)
+            entry = self.cqe[0]
+            res, key = entry.res, entry.user_data
+            liburing.io_uring_cqe_seen(self.ring, entry)
+            fd, data, path = self.pending.pop(key)
+            try:
+                if res < 0:
+                    raise OSError(-res, os.strerror(-res), str(path))
+                while res < len(data):  # short write: finish synchronously
+                    res += os.pwrite(fd, memoryview(data)[res:], res)
+            except OSError as e:
+                error = error or e
+            finally:
+                os.close(fd)
+        if error:
+            raise error
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            liburing.io_uring_queue_exit(self.ring)
+
+
+def open_write_engine() -> "IoUringBatchEngine | None":
+    """Return an io_uring write engine, or None to fall back to plain file writes."""
+    if liburing is None:
+        return None
+    try:
+        return IoUringBatchEngine()
+    except Exception:  # io_uring unavailable (old kernel, seccomp, ...)
+        return None
+
+
+def open_pdf(pdf_path: Path, password: str = None) -> "fitz.Document":
+    """Open a PDF, decrypting it if needed."""
+    doc = fitz.open(pdf_path)
+    if doc.needs_pass:
+        if not password:
+            doc.close()
+            raise ValueError("PDF is encrypted. Provide --password to open it.")
+        if not doc.authenticate(password):
+            doc.close()
+            raise ValueError("Incorrect password for encrypted PDF.")
+    return doc
+
+
+class PixmapPool:
+    """
+    Render pages into one RGB pixmap, reallocated only when the output size changes.
+
+    page.get_pixmap() allocates a fresh width*height*3 buffer per page (~13 MB
+    at 200 dpi A4). render() makes the same MuPDF calls get_pixmap() does
+    (bbox, white fill, draw device with the page matrix) against the kept
+    buffer, so output is pixel-identical. The returned pixmap is overwritten
+    by the next render(). Without fitz.mupdf, it simply calls get_pixmap().
+    """
+
+    def __init__(self):
+        self.bbox = None
+        self.raw = None
+        self.pix = None
+
+    def render(self, page: "fitz.Page", mat: "fitz.Matrix") -> "fitz.Pixmap":
+        if _mupdf is None:
+            return page.get_pixmap(matrix=mat)
+        ctm = _mupdf.FzMatrix(*mat)
+        irect = _mupdf.fz_round_rect(_mupdf.fz_transform_rect(_mupdf.fz_bound_page(page.this), ctm))
+        bbox = (irect.x0, irect.y0, irect.x1, irect.y1)
+        if bbox != self.bbox:
+            self.raw = _mupdf.fz_new_pixmap_with_bbox(fitz.csRGB.this, irect, _mupdf.FzSeparations(), 0)
+            self.pix = fitz.Pixmap("raw", self.raw)
+            self.bbox = bbox
+        _mupdf.fz_clear_pixmap_with_value(self.raw, 0xFF)
+        dev = _mupdf.fz_new_draw_device(ctm, self.raw)
+        try:
+            _mupdf.fz_run_page(page.this, dev, _mupdf.FzMatrix(), _mupdf.FzCookie())
+        finally:
+            _mupdf.fz_close_device(dev)
+        return self.pix
+
+
+def pixmap_to_pil(pix: "fitz.Pixmap") -> "Image.Image":
+    """Wrap a pixmap's samples in a Pillow image without copying; pix must outlive it."""
+    mode = PIL_MODES[pix.n]
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+
+
+def encode_pixmap(pix: "fitz.Pixmap", ext: str) -> bytes:
+    """Encode pix as ext in memory: Pillow with PIL_SAVE settings if available, else PyMuPDF."""
+    if Image is not None and ext in PIL_SAVE:
+        buf = io.BytesIO()
+        pixmap_to_pil(pix).save(buf, dpi=(pix.xres, pix.yres), **PIL_SAVE[ext])
+        return buf.getvalue()
+    if ext in {"jpg", "jpeg"}:
+        return pix.tobytes(ext, jpg_quality=95)
+    return pix.tobytes(ext)
+
+
+def scan_image_xref(page: "fitz.Page") -> int | None:
+    """
+    Return the image xref if page is a bare scan, else None.
+
+    A bare scan has no text, no annotations, no rotation, and exactly one
+    opaque image drawn upright over (nearly) the whole page.
+    """
+    images = page.get_images(full=True)
+    if len(images) != 1 or page.rotation or page.first_annot is not None:
+        return None
+    xref, smask = images[0][0], images[0][1]
+    if smask or page.get_text().strip():
+        return None
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+    bbox, m = placements[0]
+    prect = page.rect
+    tol_x, tol_y = prect.width / 100, prect.height / 100
+    if not (m.a > 0 and m.d > 0 and m.b == 0 and m.c == 0):  # flipped or rotated placement
+        return None
+    if (abs(bbox.x0 - prect.x0) > tol_x or abs(bbox.x1 - prect.x1) > tol_x
+            or abs(bbox.y0 - prect.y0) > tol_y or abs(bbox.y1 - prect.y1) > tol_y):
+        return None
+    return xref
+
+
+def embedded_image(doc: "fitz.Document", xref: int, ext: str) -> bytes | None:
+    """Return image xref as stored in the PDF if it is RGB/gray and already ext, else None."""
+    info = doc.extract_image(xref)
+    if not info or info.get("colorspace") not in (1, 3):
+        return None
+    if ("jpg" if info["ext"] == "jpeg" else info["ext"]) != ext:
+        return None
+    return info["image"]
+
+
+def raw_jpeg_span(doc: "fitz.Document", xref: int) -> "tuple[int, int] | None":
+    """
+    Return (file offset, length) of image xref's JPEG data inside the PDF file, or None.
+
+    Only for unencrypted files where the image is a plain /DCTDecode stream
+    with 1 or 3 components, stored directly in the file (not in an object
+    stream); its bytes on disk are then exactly a JPEG file.
+    """
+    if _mupdf is None or not doc.name or doc.xref_get_key(-1, "Encrypt")[0] != "null":
+        return None
+    if doc.xref_get_key(xref, "Filter") not in (("name", "/DCTDecode"), ("array", "[/DCTDecode]")):
+        return None
+    if doc.xref_get_key(xref, "DecodeParms")[0] != "null" or doc.xref_get_key(xref, "Decode")[0] != "null":
+        return None
+    kind, length = doc.xref_get_key(xref, "Length")
+    if kind != "int":
+        return None
+    pdf = _mupdf.pdf_document_from_fz_document(doc.this)
+    colorspace = _mupdf.pdf_dict_gets(_mupdf.pdf_load_object(pdf, xref), "ColorSpace")
+    if _mupdf.fz_colorspace_n(_mupdf.pdf_load_colorspace(colorspace)) not in (1, 3):
+        return None
+    entry = _mupdf.ll_pdf_get_xref_entry_no_null(pdf.m_internal, xref)
+    if entry.type != "n" or entry.stm_ofs <= 0:
+        return None
+    return entry.stm_ofs, int(length)
+
+
+def copy_file_span(src_path: str, offset: int, length: int, outpath: str) -> bool:
+    """
+    Copy length bytes at offset of src_path into outpath without passing them
+    through user space. Returns False (writing nothing) if the span does not
+    look like a complete JPEG stream.
+    """
+    with open(src_path, "rb") as src:
+        fd_in = src.fileno()
+        if os.pread(fd_in, 2, offset) != b"\xff\xd8" or b"endstream" not in os.pread(fd_in, 16, offset + length):
+            return False
+        with open(outpath, "wb") as dst:
+            fd_out = dst.fileno()
+            done = 0
+            kernel_copy = getattr(os, "copy_file_range", None)
+            while done < length:
+                if kernel_copy is not None:
+                    try:
+                        n = kernel_copy(fd_in, fd_out, length - done, offset + done)
+                    except OSError:  # e.g. EXDEV on older kernels: try sendfile
+                        kernel_copy = None
+                        continue
+                else:
+                    n = os.sendfile(fd_out, fd_in, offset + done, length - done)
+                if n <= 0:
+                    raise OSError(f"short copy into {outpath}")
+                done += n
+    return True
+
+
+def write_output(outpath: str, data: bytes, sink=None) -> None:
+    """Write one encoded page: handed to sink (PageWriter or io_uring engine), or one write()."""
+    if sink is not None:
+        sink.write(outpath, data)  # queued
+    else:
+        with open(outpath, "wb") as f:
+            f.write(data)
+
+
+class PageWriter:
+    """
+    Writer thread fed through a bounded queue of (outpath, encoded bytes).
+
+    Rendering and encoding stay on the caller's thread (MuPDF objects are not
+    shared across threads); only the file writes, through the io_uring engine
+    when there is one, happen here. A write error is re-raised on the next
+    write() or on close().
+    """
+
+    def __init__(self, engine: "IoUringBatchEngine | None" = None, depth: int = WRITE_QUEUE_PAGES):
+        self.engine = engine
+        self.queue = queue.Queue(maxsize=depth)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="page-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:  # after a failure, just drain
+                try:
+                    write_output(*item, self.engine)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, outpath: str, data: bytes) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put((outpath, data))  # blocks while the queue is full
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            if self.engine is not None:
+                self.engine.close()
+        finally:
+            if self.error is not None:
+                raise self.error
+
+
+def scale_pixmap(pix: "fitz.Pixmap", width: int, height: int) -> "fitz.Pixmap":
+    """Downscale a rendered master pixmap to width x height without re-rendering."""
+    if (pix.width, pix.height) == (width, height):
+        return pix
+    n = int(math.log2(pix.width / width)) if pix.width >= 2 * width else 0
+    if n and (-(-pix.width >> n), -(-pix.height >> n)) == (width, height):
+        small = fitz.Pixmap(pix)  # shrink() works in place; keep the master intact
+        small.shrink(n)  # box filter, halves both sides n times
+        return small
+    return fitz.Pixmap(pix, width, height, None)
+
+
+class PageTargets:
+    """
+    Per-run output layout for render_page(), built once from (zoom, outdir) targets.
+
+    scales holds each target's downscale matrix (None for the rendered size).
+    paths(pno) gives each target's <outdir>[/<shard>]/<prefix><pno>.<ext>,
+    where shard is pno // shard_size as 4 digits when shard_size is set.
+    Shard folders are created on first use.
+    """
+
+    def __init__(self, targets: "list[tuple[float | None, Path]]", prefix: str, ext: str, shard_size: int = 0):
+        self.scales = [None if zoom is None else fitz.Matrix(zoom, zoom) for zoom, _ in targets]
+        self.dirs = [str(outdir) for _, outdir in targets]
+        self.prefix = prefix
+        self.suffix = "." + ext
+        self.shard_size = shard_size
+        self.made = set()
+
+    def paths(self, pno: int) -> "list[str]":
+        name = self.prefix + str(pno) + self.suffix
+        if not self.shard_size:
+            return [os.path.join(d, name) for d in self.dirs]
+        sub = f"{pno // self.shard_size:04d}"
+        paths = []
+        for d in self.dirs:
+            d = os.path.join(d, sub)
+            if d not in self.made:
+                os.makedirs(d, exist_ok=True)
+                self.made.add(d)
+            paths.append(os.path.join(d, name))
+        return paths
+
+
+def render_page(doc: "fitz.Document", pno: int, mat: "fitz.Matrix", targets: PageTargets,
+                ext: str, sink: "PageWriter | None" = None,
+                pixmaps: PixmapPool | None = None, passthrough: bool = False) -> None:
+    """
+    Render 1-based page pno of doc once and save it as {prefix}{pno}.{ext} for
+    each target. A target's matrix is None for the rendered size, or a smaller
+    scale to downscale the rendered pixmap to. With passthrough, a bare
+    scanned page is copied out as its embedded image instead (single target only).
+    """
+    page = doc[pno - 1]  # 0-based index
+    paths = targets.paths(pno)
+    xref = scan_image_xref(page) if passthrough and len(paths) == 1 else None
+    if xref is not None:
+        outpath = paths[0]
+        span = raw_jpeg_span(doc, xref) if ext == "jpg" else None
+        if span is not None and copy_file_span(doc.name, *span, outpath):
+            return
+        data = embedded_image(doc, xref, ext)
+        if data is not None:
+            write_output(outpath, data, sink)
+            return
+    pix = pixmaps.render(page, mat) if pixmaps is not None else page.get_pixmap(matrix=mat)  # render
+    for scale, outpath in zip(targets.scales, paths):
+        out = pix
+        if scale is not None:
+            size = (page.rect * scale).irect  # what get_pixmap() at that scale would produce
+            out = scale_pixmap(pix, size.width, size.height)
+        # Encode in memory, then hand the bytes over in one write
+        write_output(outpath, encode_pixmap(out, ext), sink)
+
+
+def _render_block(pdf_path: Path, password: str, first: int, last: int,
+                  zoom: float, targets: "list[tuple[float | None, Path]]", prefix: str, ext: str,
+                  passthrough: bool = False, shard_size: int = 0) -> int:
+    """Worker: render pages first..last (1-based, inclusive) from a fresh handle."""
+    doc = open_pdf(pdf_path, password)
+    sink = PageWriter(open_write_engine())
+    try:
+        mat = fitz.Matrix(zoom, zoom)
+        prepared = PageTargets(targets, prefix, ext, shard_size)
+        pixmaps = PixmapPool()
+        for pno in range(first, last + 1):
+            render_page(doc, pno, mat, prepared, ext, sink, pixmaps, passthrough)
+            if (pno - first + 1) % STORE_SHRINK_EVERY == 0:
+                fitz.TOOLS.store_shrink(STORE_SHRINK_PERCENT)
+    finally:
+        doc.close()
+        sink.close()
+    return last - first + 1
+
+
 def convert_pdf_to_images(
     pdf_path: Path,
     outdir: Path = None,
@@ -36,56 +480,89 @@ def convert_pdf_to_images(
     password: str = None,
     start: int = None,
     end: int = None,
+    workers: int = 1,
+    render_dpi: int = None,
+    output_dpis: "list[int]" = None,
+    passthrough: bool = False,
+    shard_size: int = 0,
 ) -> int:
     """
-    Render pages of a PDF to images.
+    Render pages of a PDF to images, in `workers` processes when > 1.
+
+    Pages are rendered once at render_dpi (default: the largest output DPI) and
+    written at every DPI in output_dpis (default: [dpi]); see the module notes.
 
     Returns number of pages exported.
     """
     if outdir is None:
         outdir = pdf_path.with_suffix("")  # e.g., input.pdf -> input/
-    outdir.mkdir(parents=True, exist_ok=True)
 
     if fmt.lower() not in {"png", "jpg", "jpeg", "tiff", "tif"}:
         raise ValueError("fmt must be one of: png, jpg, jpeg, tiff, tif")
 
-    # Open PDF
-    doc = fitz.open(pdf_path)
+    output_dpis = list(dict.fromkeys(output_dpis or [dpi]))  # dedupe, keep order
+    render_dpi = render_dpi or max(output_dpis)
+    if min(output_dpis) <= 0 or max(output_dpis) > render_dpi:
+        raise ValueError(f"Output DPIs must be positive and at most --render-dpi ({render_dpi})")
+    # (zoom to downscale to, or None for the rendered size; output folder)
+    targets = [
+        (None if d == render_dpi else d / 72.0, outdir if len(output_dpis) == 1 else outdir / f"{d}dpi")
+        for d in output_dpis
+    ]
+    for _, target_dir in targets:
+        target_dir.mkdir(parents=True, exist_ok=True)
 
-    # Decrypt if needed
-    if doc.needs_pass:
-        if not password:
-            raise ValueError("PDF is encrypted. Provide --password to open it.")
-        if not doc.authenticate(password):
-            raise ValueError("Incorrect password for encrypted PDF.")
+    # Open PDF (decrypting if needed)
+    doc = open_pdf(pdf_path, password)
 
     # Clamp page range
     total_pages = doc.page_count
     first = 1 if start is None else max(1, start)
     last = total_pages if end is None else min(total_pages, end)
     if first > last:
+        doc.close()
         raise ValueError(f"Invalid range: start={first}, end={last}, total_pages={total_pages}")
 
     # Compute zoom matrix from dpi
     # 72 dpi is the PDF default; scale accordingly
-    zoom = dpi / 72.0
-    mat = fitz.Matrix(zoom, zoom)
+    zoom = render_dpi / 72.0
+    # Normalize format / extension
+    ext = "jpg" if fmt.lower() == "jpeg" else fmt.lower()
 
+    n_pages = last - first + 1
+    workers = max(1, min(workers, n_pages))
     exported = 0
-    for pno in tqdm(range(first, last + 1), desc="Rendering pages", unit="page"):
-        page = doc[pno - 1]  # 0-based index
-        pix = page.get_pixmap(matrix=mat)  # render
-        # Normalize format / extension
-        ext = "jpg" if fmt.lower() == "jpeg" else fmt.lower()
-        outpath = outdir / f"{prefix}{pno}.{ext}"
-        if ext in {"jpg", "jpeg"}:
-            # Use JPEG quality if available (PyMuPDF uses 'jpg' option)
-            pix.save(outpath, jpg_quality=95)
-        else:
-            pix.save(outpath)
-        exported += 1
+    if workers == 1:
+        mat = fitz.Matrix(zoom, zoom)
+        prepared = PageTargets(targets, prefix, ext, shard_size)
+        sink = PageWriter(open_write_engine())
+        pixmaps = PixmapPool()
+        try:
+            for pno in tqdm(range(first, last + 1), desc="Rendering pages", unit="page", mininterval=0.5):
+                render_page(doc, pno, mat, prepared, ext, sink, pixmaps, passthrough)
+                exported += 1
+                if exported % STORE_SHRINK_EVERY == 0:
+                    fitz.TOOLS.store_shrink(STORE_SHRINK_PERCENT)
+        finally:
+            doc.close()
+            sink.close()
+        return exported
 
     doc.close()
+    # Contiguous blocks, a few per worker: each block pays for one fitz.open,
+    # and the progress bar still moves more than once per worker
+    block = -(-n_pages // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as ex, \
+            tqdm(total=n_pages, desc="Rendering pages", unit="page", mininterval=0.5) as bar:
+        futures = [
+            ex.submit(_render_block, pdf_path, password, b, min(b + block - 1, last), zoom, targets, prefix, ext,
+                      passthrough, shard_size)
+            for b in range(first, last + 1, block)
+        ]
+        for fut in as_completed(futures):
+            done = fut.result()
+            exported += done
+            bar.update(done)
     return exported
 
 
@@ -94,11 +571,21 @@ def main():
     parser.add_argument("pdf", type=Path, help="Path to input PDF")
     parser.add_argument("--outdir", type=Path, default=None, help="Output folder (default: <pdf_basename>/)")
     parser.add_argument("--dpi", type=int, default=200, help="Output DPI (default: 200)")
+    parser.add_argument("--render-dpi", type=int, default=None,
+                        help="DPI to render at before downscaling (default: largest output DPI)")
+    parser.add_argument("--output-dpi", type=str, default=None,
+                        help='Comma-separated output DPIs, e.g. "300,150"; overrides --dpi')
     parser.add_argument("--fmt", type=str, default="png", help="Image format: png | jpg | jpeg | tiff | tif (default: png)")
     parser.add_argument("--prefix", type=str, default="page_", help="Filename prefix (default: page_)")
     parser.add_argument("--password", type=str, default=None, help="Password for encrypted PDFs")
+    parser.add_argument("--passthrough", action="store_true",
+                        help="Copy out embedded images of bare scanned pages instead of re-rendering them")
+    parser.add_argument("--shard-size", type=int, default=0,
+                        help="Max files per output subfolder (<page // N> as 4 digits; default 0 = flat)")
     parser.add_argument("--start", type=int, default=None, help="Start page (1-based, inclusive)")
     parser.add_argument("--end", type=int, default=None, help="End page (1-based, inclusive)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Rendering processes (default: {DEFAULT_WORKERS}; 1 = render in this process)")
 
     args = parser.parse_args()
 
@@ -117,6 +604,11 @@ def main():
             password=args.password,
             start=args.start,
             end=args.end,
+            workers=args.workers,
+            render_dpi=args.render_dpi,
+            output_dpis=[int(d) for d in args.output_dpi.split(",") if d.strip()] if args.output_dpi else None,
+            passthrough=args.passthrough,
+            shard_size=args.shard_size,
         )
         print(f"Done. Exported {count} page(s) to {args.outdir or pdf_path.with_suffix('')}")
     except Exception as e:
@@ -0,0 +1,64 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import FreeText
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from pdf_split_by_pages import write_pages  # noqa: E402
+
+ANNOTS_PER_PAGE = 3
+
+
+def make_annotated_pdf(path: Path, n_pages: int) -> None:
+    """Write n_pages blank pages, each with ANNOTS_PER_PAGE labelled annotations."""
+    writer = PdfWriter()
+    for i in range(n_pages):
+        writer.add_blank_page(200, 200)
+        for k in range(ANNOTS_PER_PAGE):
+            writer.add_annotation(i, FreeText(text=f"p{i + 1}a{k}", rect=(10, 10 + 40 * k, 100, 40 + 40 * k)))
+    writer.write(str(path))
+
+
+def annot_labels(path: Path) -> list:
+    """Per output page, the /Contents of its annotations."""
+    return [
+        [a.get_object()["/Contents"] for a in (page.get("/Annots") or [])]
+        for page in PdfReader(str(path)).pages
+    ]
+
+
+class WritePagesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        make_annotated_pdf(self.dir / "in.pdf", 5)
+        self.reader = PdfReader(str(self.dir / "in.pdf"))
+        self.pages = list(self.reader.pages)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self, numbers, dedupe=False):
+        outpath = self.dir / "out.pdf"
+        written = write_pages(self.reader, [self.pages[p - 1] for p in numbers], outpath, dedupe=dedupe)
+        self.assertEqual(written, len(numbers))
+        expected = [[f"p{p}a{k}" for k in range(ANNOTS_PER_PAGE)] for p in numbers]
+        self.assertEqual(annot_labels(outpath), expected)
+
+    def test_distinct_pages_keep_annotations(self):
+        self.check([2, 4, 5])
+
+    def test_repeated_pages_keep_annotations(self):
+        self.check([1, 1, 2])
+
+    def test_repeated_pages_keep_annotations_deduped(self):
+        # the --extract path
+        self.check([1, 1, 2, 5, 3, 4, 3, 3], dedupe=True)
+
+
+if __name__ == "__main__":
+    unittest.main()